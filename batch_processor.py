@@ -0,0 +1,94 @@
+"""Reprocess a directory of bags in parallel.
+
+    python batch_processor.py bags/ --output walls.jsonl --shard-seconds 30
+
+Every bag is cut into shards of shard_seconds, the shards are spread over
+a process pool, and each frame is run through wall_grower.process_frame.
+The per frame results come back in bag then time order, whichever worker
+finishes first. """
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from data_handler import DataLoader
+from wall_grower import process_frame
+
+def find_bags(directory):
+    return sorted(glob.glob(os.path.join(directory, "*.bag")))
+
+def make_shards(bags, shard_seconds=60., loader=DataLoader):
+    """(bag, start_time, end_time) for consecutive time ranges of every bag.
+    The last shard of a bag ends just past its last message, since end
+    times are excluded."""
+    shards = []
+    for bag in bags:
+        data_loader = loader(bag)
+        first, last = data_loader.time_range()
+        data_loader.close()
+        start = first
+        while True:
+            end = start + shard_seconds
+            if end > last:
+                shards.append((bag, start, last + 1e-6))
+                break
+            shards.append((bag, start, end))
+            start = end
+    return shards
+
+def process_shard(shard, settings=None, loader=DataLoader):
+    """run every frame of a shard through process_frame.
+
+    returns a list with a dict for each frame, holding its bag, time,
+    point count and walls as [x0 y0 x1 y1] segments. Lines are turned into
+    plain lists so they're cheap to send back from the worker."""
+    bag, start, end = shard
+    data_loader = loader(bag, start, end)
+    results = []
+    try:
+        for time, points in data_loader.frames():
+            _, lines, _ = process_frame(points, **(settings or {}))
+            results.append({"bag": bag, "time": time, "n_points": len(points),
+                "walls": [list(l.start_point) + list(l.end_point) for l in lines]})
+    finally:
+        data_loader.close()
+    return results
+
+class BatchProcessor(object):
+    def __init__(self, directory, shard_seconds=60., processes=None, settings=None, loader=DataLoader):
+        """settings are passed on to process_frame. loader is the class
+        reading the bags, with DataLoader's constructor, time_range,
+        frames and close."""
+        self.bags = find_bags(directory)
+        self.shard_seconds = shard_seconds
+        self.processes = processes
+        self.settings = settings or {}
+        self.loader = loader
+
+    def run(self):
+        """yield the result of every frame of every bag, in order"""
+        shards = make_shards(self.bags, self.shard_seconds, self.loader)
+        if self.processes == 1:
+            for shard in shards:
+                yield from process_shard(shard, self.settings, self.loader)
+            return
+
+        #map hands back the shards in the order they were submitted,
+        #holding on to any that finish early
+        n = len(shards)
+        with ProcessPoolExecutor(self.processes) as executor:
+            for results in executor.map(process_shard, shards, [self.settings] * n, [self.loader] * n):
+                yield from results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="find the walls in every frame of a directory of bags")
+    parser.add_argument("directory")
+    parser.add_argument("--output", default="walls.jsonl", help="one json line per frame")
+    parser.add_argument("--shard-seconds", type=float, default=60.)
+    parser.add_argument("--processes", type=int, default=None, help="defaults to every core")
+    args = parser.parse_args()
+
+    processor = BatchProcessor(args.directory, args.shard_seconds, args.processes)
+    with open(args.output, "w") as f:
+        for result in processor.run():
+            f.write(json.dumps(result) + "\n")
@@ -0,0 +1,193 @@
+"""Time every stage of the wall finding pipeline on synthetic rooms from
+mock_data, so performance regressions show up without a rosbag on hand.
+
+    python benchmark.py --scales 10000 100000 1000000 --json results.json
+
+Each scale is run twice, once timed and once under tracemalloc for the
+peak memory of each stage, since tracing slows the stages down. """
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+from mock_data import make_room, score_walls
+from pointcloud import Pointcloud
+from wall_grower import WallGrower
+from line import LCPopulation
+from genetic_optimizer import GASelector
+
+def run_pipeline(scene, trace_memory=False, n_centroids=400, n_linecasters=100, n_generations=20):
+    """run the pipeline from wall_grower.py on a MockedScene.
+
+    returns a list of stage results with the seconds taken, the points
+    in and out and (if trace_memory) the peak bytes allocated, and a dict
+    with the accuracy of the walls found"""
+    stages = []
+    def stage(name, n_in, function):
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        out = function()
+        seconds = time.perf_counter() - start
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        stages.append({"stage": name, "seconds": seconds, "points_in": n_in,
+            "points_out": len(pointcloud.points), "peak_bytes": peak})
+        return out
+
+    pointcloud = Pointcloud(scene.points)
+    n = lambda: len(pointcloud.points)
+    stage("remove_floor", n(), lambda: pointcloud.remove_floor(floor=.05))
+    stage("take_xy", n(), pointcloud.take_xy)
+    stage("take_percentage", n(), lambda: pointcloud.take_percentage(.5))
+    stage("biased_undersample", n(), lambda: pointcloud.biased_undersample(percentile=.1, radius=.6))
+    stage("take_centroids", n(), lambda: pointcloud.take_centroids(min(n_centroids, n()), exact=True))
+
+    wg = WallGrower(pointcloud)
+    _, lines = stage("make_network", n(), lambda: wg.make_network(max_distance=.4,
+        corner_threshold=2.7, min_length=3))
+    _, ransac_lines = stage("make_ransac_network", n(), lambda: wg.make_ransac_network(.05, min_length=3))
+
+    centroids = pointcloud.points
+    population = LCPopulation(centroids, local_neighborhood_radius=.4)
+    stage("linecasters", n(), lambda: population.add_random(n_linecasters))
+    gas = GASelector(population, population.pointcloud, popsize=100, lines_in_sol=10,
+        local_neighborhood_radius=.04)
+    def evolve():
+        for _ in range(n_generations):
+            gas.run_iter()
+    stage("ga_selector", n(), evolve)
+
+    accuracy = {}
+    accuracy["make_network_precision"], accuracy["make_network_recall"] = score_walls(lines, scene.walls)
+    accuracy["ransac_precision"], accuracy["ransac_recall"] = score_walls(ransac_lines, scene.walls)
+    #the linecasters are unbounded, so score the fraction of centroids they explain
+    accuracy["ga_explained"] = gas.best_solution()["score"] / float(len(centroids))
+    return stages, {key: float(value) for key, value in accuracy.items()}
+
+def benchmark(scales, seed=0, **kwargs):
+    """run_pipeline at every scale, returns a list of results"""
+    results = []
+    for n_points in scales:
+        scene = make_room(n_points, seed=seed)
+        for trace_memory in [False, True]:
+            #reseed so both runs take the same random choices
+            random.seed(seed)
+            np.random.seed(seed)
+            stages, accuracy = run_pipeline(scene, trace_memory, **kwargs)
+            if not trace_memory:
+                timed = stages
+            else:
+                for timed_stage, traced_stage in zip(timed, stages):
+                    timed_stage["peak_bytes"] = traced_stage["peak_bytes"]
+        results.append({"n_points": n_points, "stages": timed, "accuracy": accuracy})
+    return results
+
+def import_times(modules, repeats=3):
+    """seconds each module takes to import in a fresh interpreter, on top 
+    of numpy. Worker processes pay this before touching any data."""
+    def best_time(code):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.check_call([sys.executable, "-c", code])
+            times.append(time.perf_counter() - start)
+        return min(times)
+    baseline = best_time("import numpy")
+    return {module: best_time("import numpy, %s" % module) - baseline for module in modules}
+
+def kernel_times(repeats=5, seed=0):
+    """seconds per call of each kernel's python and numba versions, on 
+    inputs the size of a frame's. The numba versions are compiled first. 
+    Without numba only the python times are given."""
+    import kernels
+    rng = np.random.RandomState(seed)
+
+    #a wall's network: a chain with a short spur every 20 points
+    n = 400
+    neighbors = [set() for _ in range(n)]
+    for a in range(1, n):
+        b = a - 2 if a % 20 == 0 else a - 1
+        neighbors[a].add(b)
+        neighbors[b].add(a)
+    indptr = np.cumsum([0] + [len(ns) for ns in neighbors])
+    indices = np.array([o for ns in neighbors for o in sorted(ns)], dtype=np.int64)
+    coverage = np.packbits(rng.rand(100, 400) < .05, axis=1)
+    solutions = rng.randint(0, 100, (100, 10))
+    thetas = rng.uniform(-np.pi, np.pi, 2000)
+    skip = np.zeros(2000, dtype=bool)
+    from pointcloud import _Grid
+    xy = make_room(30000, seed=seed).points[:, :2]
+    grid = _Grid(xy, .1 / np.sqrt(2), reach=2)
+    close_indexes = rng.choice(len(xy), 3000, replace=False)
+    starts, counts = grid.nearby_cells(close_indexes)
+
+    calls = {
+        "longest_path": lambda f: f(0, indptr, indices, np.zeros(n, dtype=bool)),
+        "coverage_scores": lambda f: f(coverage, solutions, 1024),
+        "spread_angles": lambda f: f(thetas, skip, .05),
+        "count_close": lambda f: f(xy, close_indexes, starts, counts, grid.order, .1, 4),
+    }
+    times = {}
+    for name, call in calls.items():
+        for version in ["python", "numba"]:
+            function = getattr(kernels, "%s_%s" % (version, name), None)
+            if function is None:
+                continue
+            call(function)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                call(function)
+            times[(name, version)] = (time.perf_counter() - start) / repeats
+    return times
+
+def print_results(results):
+    for result in results:
+        print("%d points" % result["n_points"])
+        print("  %-20s %10s %14s %10s %12s" % ("stage", "ms", "points/s", "out", "peak MB"))
+        for s in result["stages"]:
+            throughput = s["points_in"] / s["seconds"] if s["seconds"] else float("inf")
+            print("  %-20s %10.1f %14.0f %10d %12.1f" % (s["stage"], 1000 * s["seconds"],
+                throughput, s["points_out"], s["peak_bytes"] / 1e6))
+        print("  " + ", ".join("%s %.2f" % item for item in result["accuracy"].items()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--centroids", type=int, default=400)
+    parser.add_argument("--generations", type=int, default=20)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--profile", help="also profile the substeps of every stage into this file")
+    parser.add_argument("--imports", action="store_true", help="also time importing the pipeline modules")
+    parser.add_argument("--kernels", action="store_true", help="also compare the python and numba kernels")
+    args = parser.parse_args()
+
+    if args.kernels:
+        for (name, version), seconds in kernel_times().items():
+            print("kernel %-16s %-7s %10.3f ms" % (name, version, 1000 * seconds))
+
+    if args.imports:
+        for module, seconds in import_times(["pointcloud", "line", "wall_grower", 
+                "genetic_optimizer", "hough", "ring_segmenter", "data_handler"]).items():
+            print("import %-20s %6.1f ms" % (module, 1000 * seconds))
+
+    from profiling import Profiler
+    profiler = Profiler()
+    if args.profile:
+        profiler.enable()
+    results = benchmark(args.scales, args.seed, n_centroids=args.centroids,
+        n_generations=args.generations)
+    profiler.disable()
+    print_results(results)
+    if args.profile:
+        print(profiler.summary())
+        profiler.save(args.profile)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -1,9 +1,39 @@
-import rosbag, sensor_msgs.point_cloud2
-
 class DataLoader(object):
-    def __init__(self, filename):
+    def __init__(self, filename, start_time=None, end_time=None, topic="/velodyne_points"):
+        """read the frames of one bag, optionally only those stamped
+        between start_time and end_time seconds (end_time excluded)"""
+        #rosbag is only installed where bags are read
+        import rosbag
+        self.filename = filename
         self.bag = rosbag.Bag(filename)
+        self.start_time = start_time
+        self.end_time = end_time
+        self.topic = topic
+        self.messages = None
+
+    def time_range(self):
+        """the first and last message times in the bag, in seconds"""
+        return self.bag.get_start_time(), self.bag.get_end_time()
+
+    def frames(self):
+        """yield (time in seconds, points) for every frame in the time range,
+        reading the bag as it goes"""
+        import rospy
+        import sensor_msgs.point_cloud2
+        start = rospy.Time.from_sec(self.start_time) if self.start_time is not None else None
+        end = rospy.Time.from_sec(self.end_time) if self.end_time is not None else None
+        for topic, msg, time in self.bag.read_messages(topics=[self.topic], start_time=start, end_time=end):
+            #rosbag's end_time is inclusive
+            if self.end_time is not None and time.to_sec() >= self.end_time:
+                break
+            yield time.to_sec(), list(sensor_msgs.point_cloud2.read_points(msg))
 
     def load_next_frame(self):
-        topic, msg, time = next(self.bag.read_messages(topics=["/velodyne_points"]))
-        return list(sensor_msgs.point_cloud2.read_points(msg))
\ No newline at end of file
+        """the points of the next frame. Raises StopIteration after the last one"""
+        if self.messages is None:
+            self.messages = self.frames()
+        time, points = next(self.messages)
+        return points
+
+    def close(self):
+        self.bag.close()
@@ -0,0 +1,95 @@
+import numpy as np
+
+class FloorPlane(object):
+    """Estimate the floor as a plane, frame by frame. 
+
+    The plane is stored as a unit normal pointing up and an offset, so 
+    the height of a point above the floor is point . normal + offset. 
+    Each fit starts from the previous frame's plane when there is one, 
+    which makes the candidate points for the fit cheap to pick."""
+    def __init__(self, max_distance=.03, max_tilt=.3, bin_size=.05, warm_band=.15, 
+            max_samples=500, n_hypotheses=64, min_points=30):
+        """max_distance is how far from the plane a point can be and still 
+        count as floor while fitting. max_tilt is the largest angle in radians 
+        the floor is allowed to make with the xy plane."""
+        self.max_distance = max_distance
+        self.max_tilt = max_tilt
+        self.bin_size = bin_size
+        self.warm_band = warm_band
+        self.max_samples = max_samples
+        self.n_hypotheses = n_hypotheses
+        self.min_points = min_points
+
+        self.normal = None
+        self.offset = None
+
+    def heights(self, points):
+        """signed distance of every point above the plane"""
+        return np.asarray(points, dtype=float)[:, :3] @ self.normal + self.offset
+
+    def fit(self, points):
+        """fit the plane to a frame of [x y z ...] points. If no plane can 
+        be found, the previous one is kept. Returns whether a plane is known."""
+        xyz = np.asarray(points, dtype=float)[:, :3]
+        if not len(xyz):
+            return self.normal is not None
+
+        candidates = None
+        if self.normal is not None:
+            #warm start: the floor hasn't moved much since the last frame 
+            candidates = xyz[np.abs(xyz @ self.normal + self.offset) < self.warm_band]
+        if candidates is None or len(candidates) < self.min_points:
+            candidates = self._lowest_layer(xyz)
+        if len(candidates) < self.min_points:
+            return self.normal is not None
+
+        if len(candidates) > self.max_samples:
+            candidates = candidates[np.random.choice(len(candidates), self.max_samples, replace=False)]
+        plane = self._ransac(candidates)
+        if plane is not None:
+            self.normal, self.offset = plane
+        return self.normal is not None
+
+    def _lowest_layer(self, xyz):
+        """the points in the lowest well populated height bin, padded by 
+        enough to catch a floor tilted by max_tilt"""
+        z = xyz[:, 2]
+        bins = np.floor((z - z.min()) / self.bin_size).astype(np.int64)
+        counts = np.bincount(bins)
+        populated = np.nonzero(counts >= max(self.min_points, .02 * len(z)))[0]
+        if not len(populated):
+            return xyz[:0]
+        floor_height = z.min() + (populated[0] + .5) * self.bin_size
+        extent = np.ptp(xyz[:, :2], axis=0).max() / 2
+        band = self.bin_size + np.tan(self.max_tilt) * extent
+        return xyz[np.abs(z - floor_height) < band]
+
+    def _ransac(self, candidates):
+        """score n_hypotheses planes through random triples of candidates at 
+        once, then refit the best one to its inliers with least squares"""
+        triples = candidates[np.random.randint(0, len(candidates), (self.n_hypotheses, 3))]
+        normals = np.cross(triples[:, 1] - triples[:, 0], triples[:, 2] - triples[:, 0])
+        lengths = np.linalg.norm(normals, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            normals /= lengths[:, None]
+        normals *= np.sign(normals[:, 2:])
+        usable = (lengths > 0) & (normals[:, 2] > np.cos(self.max_tilt))
+        if not usable.any():
+            return None
+        normals = normals[usable]
+        offsets = -np.sum(normals * triples[usable, 0], axis=1)
+
+        inliers = np.abs(candidates @ normals.T + offsets) < self.max_distance
+        best = np.argmax(inliers.sum(axis=0))
+        inliers = candidates[inliers[:, best]]
+        if len(inliers) < 3:
+            return normals[best], offsets[best]
+
+        #the least squares plane's normal is the direction of least variance 
+        centroid = inliers.mean(axis=0)
+        centered = inliers - centroid
+        _, vectors = np.linalg.eigh(centered.T @ centered)
+        normal = vectors[:, 0] * np.sign(vectors[2, 0])
+        if normal[2] < np.cos(self.max_tilt):
+            normal, centroid = normals[best], triples[usable][best, 0]
+        return normal, -normal @ centroid
@@ -1,81 +1,78 @@
-from random import randint, choice, choices 
-from line import Line, line_point_distance
+from line import line_point_distances
 import numpy as np
 
+def line_point_distance_matrix(linecasters, pointcloud):
+    """Calculate the distance between every line and every point"""
+    points = np.asarray(pointcloud.points, dtype=float)[:, :2]
+    return np.array([line_point_distances(lc.line, points) 
+        for lc in linecasters.linecasters]).reshape(len(linecasters.linecasters), len(points))
+
 class GASelector(object):
-    def __init__(self, linecasters, pointcloud, popsize=100, lines_in_sol=10, local_neighborhood_radius=.04):
-        """Set up a genetic algorithm metaheuristic"""
-        #one solution is an ordered list of indexes of lines
-        self.solutions = []
+    def __init__(self, linecasters, pointcloud, popsize=100, lines_in_sol=10, local_neighborhood_radius=.04, 
+            mutation_rate=.1):
+        """Set up a genetic algorithm metaheuristic. 
+        
+        The population is a (popsize, lines_in_sol) array, each row one 
+        solution holding indexes of lines, with a matching array of scores. 
+        Every generation is bred, mutated and scored as whole arrays."""
         self.linecasters = linecasters 
         self.pointcloud = pointcloud 
         self.local_neighborhood_radius = local_neighborhood_radius
+        self.mutation_rate = mutation_rate
+        self.n_lines = len(self.linecasters.linecasters)
 
         self._make_line_point_distance_matrix()
 
+        #which points each line explains, packed 8 points to a byte so 
+        #combining lines is a bitwise or over short rows
+        self.coverage = np.packbits(self.matrix < self.local_neighborhood_radius, axis=1)
+
         #init some randomly selected groups of solutions
-        for _ in range(popsize):
-            line_indexes = [randint(0, len(self.linecasters.linecasters)-1) for _ in range(lines_in_sol)]
-            self.solutions.append(self._make_solution(line_indexes))
+        self.population = np.random.randint(0, self.n_lines, (popsize, lines_in_sol))
+        self.scores = self._score(self.population)
 
     def _make_line_point_distance_matrix(self):
         """Calculate the distance between every line and every point"""
-        #first, compute the distance matrix between each line and each point 
-        matrix = []
-        for lc in self.linecasters.linecasters:
-            distances = [line_point_distance(lc.line, point) for point in self.pointcloud.points]
-            matrix.append(distances)
-        self.matrix = matrix
+        self.matrix = line_point_distance_matrix(self.linecasters, self.pointcloud)
 
+    def _score(self, solutions, chunk_size=1024):
+        """determine the score of every row of line indexes. A solution's 
+        score is the number of points explained by at least one of its lines. 
+        See kernels.coverage_scores"""
+        from kernels import coverage_scores
+        return coverage_scores(self.coverage, solutions, chunk_size)
+                
+    def run_iter(self):
+        """pair every solution with another solution, generate a child, 
+        then replace the lowest performing solution's parent if the child outperforms it. 
+        When several children replace the same solution, the best one wins. """
+        popsize, lines_in_sol = self.population.shape
+        solution_indexes = np.arange(popsize)
 
-    def _make_solution(self, line_indexes):
-        """associate an ordered collection of lines with a score"""
-        return {
-            "lines": line_indexes,
-            "score": self._score(line_indexes)
-        }
+        #select another solution that is not this one 
+        others = (solution_indexes + np.random.randint(1, max(popsize, 2), popsize)) % popsize
 
-    def _score(self, line_indexes):
-        """determine the score of a list of line indexes"""
-        explained = np.zeros(len(self.pointcloud.points))
-        score = 0
-        for line_index in line_indexes:
-            for (point_index, point_index_explained) in enumerate(explained):
-                #check that this point hasn't already been explained
-                if point_index_explained:
-                    continue 
+        #generate children from the combined lines of both parents 
+        gene_pool = np.hstack([self.population, self.population[others]])
+        picks = np.random.randint(0, 2 * lines_in_sol, (popsize, lines_in_sol))
+        children = gene_pool[solution_indexes[:, None], picks]
 
-                #check if this point is being explained 
-                if self.matrix[line_index][point_index] < self.local_neighborhood_radius:
-                    explained[point_index] = 1 #disable this point
-                    score += 1
-        return score 
-                
-                
-    def run_iter(self):
-        """loop through every solution, select another solution, generate a child, 
-        then replace the lowest performing solution's parent if the child outperforms it.  """
-        for (solution_index, solution) in enumerate(self.solutions):
-            #select another solution that is not this one 
-            other_solution_index = solution_index 
-            while other_solution_index == solution_index:
-                other_solution_index = randint(0, len(self.solutions) - 1)
-            
-            #combine lines from both parents 
-            gene_pool = list(set(self.solutions[other_solution_index]["lines"]) | set(solution["lines"]))
-            #generate child 
-            child = choices(gene_pool, k=len(solution["lines"]))
-            if len(child) < len(solution):
-                continue
-            #mutate gene 
-            child[4] = max(child[4] - 1, 0)
-            child = self._make_solution(child)
+        #mutate genes by swapping in random lines
+        mutations = np.random.rand(popsize, lines_in_sol) < self.mutation_rate
+        children[mutations] = np.random.randint(0, self.n_lines, mutations.sum())
+        child_scores = self._score(children)
 
-            #compare child to parents
-            if child["score"] > solution["score"]:
-                self.solutions[solution_index] = child
-            elif child["score"] > self.solutions[other_solution_index]["score"]:
-                self.solutions[other_solution_index] = child 
+        #compare children to parents
+        targets = np.where(child_scores > self.scores, solution_indexes, 
+            np.where(child_scores > self.scores[others], others, -1))
+        winners = np.nonzero(targets >= 0)[0]
+        winners = winners[np.lexsort((-child_scores[winners], targets[winners]))]
+        first = np.ones(len(winners), dtype=bool)
+        first[1:] = targets[winners][1:] != targets[winners][:-1]
+        winners = winners[first]
+        self.population[targets[winners]] = children[winners]
+        self.scores[targets[winners]] = child_scores[winners]
 
     def best_solution(self):
-        return max(self.solutions, key=lambda x: x["score"])
\ No newline at end of file
+        best = np.argmax(self.scores)
+        return {"lines": self.population[best].tolist(), "score": int(self.scores[best])}
@@ -1,9 +1,36 @@
-from matplotlib import pyplot as plt 
+from matplotlib import pyplot as plt
+from matplotlib.collections import LineCollection
+import numpy as np
 
-def graph_pointcloud(pointcloud, s=1, c="blue", title="points"):
-    x = [p[0] for p in pointcloud.points]
-    y = [p[1] for p in pointcloud.points]
-    plt.scatter(x, y, s=s, c=c, label=title)
+#the default colors, cycled through as things are drawn
+COLORS = ["red", "orange", "blue", "purple"]
+
+def _xy(pointcloud):
+    """the points' x and y columns as an (n, 2) float array"""
+    points = np.asarray(pointcloud.points, dtype=float)
+    return points[:, :2] if points.ndim == 2 else np.empty((0, 2))
+
+def decimate(xy, resolution=1000):
+    """indexes of one point per pixel of a resolution by resolution image
+    of the points' bounding box. A scatter with more points than pixels
+    looks the same, but takes much longer to draw. Order is kept."""
+    if resolution is None or len(xy) <= resolution:
+        return np.arange(len(xy))
+    low = xy.min(axis=0)
+    span = np.ptp(xy, axis=0).max() or 1.
+    pixels = np.floor((xy - low) / span * (resolution - 1)).astype(np.int64)
+    _, keep = np.unique(pixels[:, 0] * resolution + pixels[:, 1], return_index=True)
+    return np.sort(keep)
+
+def graph_pointcloud(pointcloud, s=1, c="blue", title="points", resolution=1000, ax=None):
+    """scatter the points. Dense clouds are decimated to resolution, pass
+    None to draw every point. c can be a color or one value per point."""
+    ax = ax or plt.gca()
+    xy = _xy(pointcloud)
+    keep = decimate(xy, resolution)
+    if np.ndim(c) and len(c) == len(xy) and not isinstance(c, str):
+        c = np.asarray(c)[keep]
+    ax.scatter(xy[keep, 0], xy[keep, 1], s=s, c=c, label=title)
 
 def show_graphs(title=""):
     plt.legend()
@@ -15,36 +42,112 @@ def graph_line_segment(pointA, pointB, points, color):
     y = [points[pointA][1], points[pointB][1]]
     plt.plot(x, y, c=color)
 
+def _add_lines(ax, segments, colors, color_indexes, linewidth=1, label=None):
+    """draw (n, 2, 2) segments as one LineCollection, instead of a
+    plt.plot call per segment"""
+    if not len(segments):
+        return None
+    collection = LineCollection(segments, colors=[colors[i] for i in color_indexes],
+        linewidths=linewidth, label=label)
+    ax.add_collection(collection)
+    ax.autoscale_view()
+    return collection
 
-def graph_line_segments(linesegments, pointcloud, colors=None):
+def graph_line_segments(linesegments, pointcloud, colors=None, ax=None, label=None):
+    """linesegments is an (n, 2) array of pairs of indexes into pointcloud.points.
+    The color changes whenever the first index does."""
     if colors is None:
-        colors = ["red", "orange", "blue", "purple"]
-    color_index = 0 
-    for key in linesegments: 
-        color_index = (color_index + 1) % (len(colors))
-        for otherline in linesegments[key]:
-            graph_line_segment(key, otherline, pointcloud.points, colors[color_index])
-
-def graph_polylines(polylines, pointcloud, colors=None):
+        colors = COLORS
+    linesegments = np.asarray(linesegments, dtype=np.intp).reshape(-1, 2)
+    xy = _xy(pointcloud)
+    new_key = np.ones(len(linesegments), dtype=bool)
+    new_key[1:] = linesegments[1:, 0] != linesegments[:-1, 0]
+    return _add_lines(ax or plt.gca(), xy[linesegments], colors,
+        np.cumsum(new_key) % len(colors), label=label)
+
+def graph_polylines(polylines, pointcloud, colors=None, ax=None, label=None):
+    """polylines are ordered lists of indexes into pointcloud.points,
+    each drawn in the next color"""
     if colors is None:
-        colors = ["red", "orange", "blue", "purple"]
-    color_index = 0 
-    for polyline in polylines: 
-        color_index = (color_index + 1) % (len(colors))
-        prev_point = polyline[0]
-        for i in range(1, len(polyline) - 1):
-            point = polyline[i]
-            graph_line_segment(prev_point, point, pointcloud.points, colors[color_index])
-            prev_point = point
-
-def graph_slope_intercept_lines(lines, pointcloud, colors=None, l=1):
+        colors = COLORS
+    polylines = [pl for pl in polylines if len(pl) > 1]
+    if not polylines:
+        return None
+    xy = _xy(pointcloud)
+    starts = np.concatenate([pl[:-1] for pl in polylines]).astype(np.intp)
+    ends = np.concatenate([pl[1:] for pl in polylines]).astype(np.intp)
+    color_indexes = np.repeat((np.arange(len(polylines)) + 1) % len(colors),
+        [len(pl) - 1 for pl in polylines])
+    return _add_lines(ax or plt.gca(), np.stack([xy[starts], xy[ends]], axis=1),
+        colors, color_indexes, label=label)
+
+def graph_slope_intercept_lines(lines, pointcloud, colors=None, l=1, ax=None, label=None):
     if colors is None:
-        colors = ["red", "orange", "blue", "purple"]
-    color_index = 0 
-    for line in lines:
-        color_index = (color_index + 1) % (len(colors))
-        x0 = line.params["low"]
-        x1 = line.params["high"]
-        y0 = line.params["m"]*x0 + line.params["b"]
-        y1 = line.params["m"]*x1 + line.params["b"]
-        plt.plot([x0, x1], [y0, y1], c=colors[color_index], linewidth=l)
\ No newline at end of file
+        colors = COLORS
+    params = [(line.params["m"], line.params["b"], line.params["low"], line.params["high"]) for line in lines]
+    m, b, x0, x1 = np.array(params, dtype=float).reshape(-1, 4).T
+    segments = np.stack([np.column_stack([x0, m*x0 + b]), np.column_stack([x1, m*x1 + b])], axis=1)
+    return _add_lines(ax or plt.gca(), segments, colors,
+        (np.arange(len(lines)) + 1) % len(colors), linewidth=l, label=label)
+
+
+class FrameRenderer(object):
+    """Render frames to image files on a background thread, so the
+    pipeline doesn't wait on matplotlib.
+
+        with FrameRenderer() as renderer:
+            for i, frame in enumerate(frames):
+                ...
+                renderer.render("frame_%04d.png" % i, pointcloud, linesegments, lines)
+
+    Each frame gets its own Figure rather than going through pyplot,
+    which isn't safe to use from another thread."""
+    def __init__(self, figsize=(10, 10), dpi=100, resolution=1000, max_pending=4):
+        """at most max_pending frames are queued, after that render
+        blocks until the worker catches up, so memory stays bounded"""
+        from concurrent.futures import ThreadPoolExecutor
+        from threading import BoundedSemaphore
+        self.figsize = figsize
+        self.dpi = dpi
+        self.resolution = resolution
+        self.executor = ThreadPoolExecutor(1)
+        self.pending = BoundedSemaphore(max_pending)
+
+    def render(self, filename, pointcloud, linesegments=(), lines=(), title=""):
+        """queue a frame to be drawn to filename, returns a future.
+        The points and segments are copied now, so the pointcloud can
+        keep changing while the frame is drawn."""
+        from pointcloud import Pointcloud
+        snapshot = Pointcloud(np.array(pointcloud.points, dtype=float))
+        linesegments = np.array(linesegments, dtype=np.intp)
+        lines = list(lines)
+        self.pending.acquire()
+        try:
+            future = self.executor.submit(self._draw, filename, snapshot, linesegments, lines, title)
+        except BaseException:
+            self.pending.release()
+            raise
+        future.add_done_callback(lambda _: self.pending.release())
+        return future
+
+    def _draw(self, filename, pointcloud, linesegments, lines, title):
+        from matplotlib.figure import Figure
+        figure = Figure(figsize=self.figsize, dpi=self.dpi)
+        ax = figure.add_subplot()
+        graph_pointcloud(pointcloud, s=4, c="orange", resolution=self.resolution, ax=ax)
+        graph_line_segments(linesegments, pointcloud, colors=["gray"], ax=ax)
+        graph_slope_intercept_lines(lines, pointcloud, colors=["black"], l=3, ax=ax)
+        ax.set_aspect("equal")
+        ax.set_title(title)
+        figure.savefig(filename)
+        return filename
+
+    def close(self):
+        """wait for every queued frame to be written"""
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
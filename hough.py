@@ -0,0 +1,74 @@
+from line import Line
+import numpy as np 
+
+def hough_accumulator(points, n_thetas=180, rho_resolution=.05, chunk_size=4096):
+    """vote every point into a (theta, rho) histogram without rasterizing. 
+    
+    theta is the angle of a line's normal, and rho is the line's signed distance 
+    from the origin, so a point votes for every line x*cos(theta) + y*sin(theta) = rho 
+    passing through it. 
+
+    returns the accumulator, the theta of each row, and the rho of each column"""
+    xy = np.asarray(points, dtype=float)[:, :2]
+    thetas = np.linspace(0, np.pi, n_thetas, endpoint=False)
+    max_rho = np.hypot(xy[:, 0], xy[:, 1]).max() if len(xy) else 0
+    n_rhos = int(np.ceil(2 * max_rho / rho_resolution)) + 1
+    rhos = np.arange(n_rhos) * rho_resolution - max_rho
+    accumulator = _vote(xy, thetas, rhos, rho_resolution, chunk_size)
+    return accumulator, thetas, rhos
+
+def _vote(xy, thetas, rhos, rho_resolution, chunk_size=4096):
+    """count the votes of xy into the (theta, rho) bins. Points 
+    are voted in chunks to keep memory bounded."""
+    cos_sin = np.vstack([np.cos(thetas), np.sin(thetas)])
+    row_offsets = np.arange(len(thetas)) * len(rhos)
+    accumulator = np.zeros(len(thetas) * len(rhos), dtype=np.int64)
+    for start in range(0, len(xy), chunk_size):
+        rho_bins = np.rint((xy[start:start + chunk_size] @ cos_sin - rhos[0]) / rho_resolution)
+        rho_bins = np.clip(rho_bins, 0, len(rhos) - 1).astype(np.int64)
+        accumulator += np.bincount((rho_bins + row_offsets).ravel(), minlength=len(accumulator))
+    return accumulator.reshape(len(thetas), len(rhos))
+
+def hough_lines(points, n_thetas=180, rho_resolution=.05, min_votes=10, max_lines=20, suppression=(5, 5)):
+    """find the lines with the most support in a sparse array of points. 
+    
+    Peaks are taken from the accumulator one at a time. After a peak is taken, 
+    the points supporting it take their votes back and the surrounding 
+    suppression window of (theta bins, rho bins) is cleared. Without this, a 
+    long dense wall also produces strong peaks at nearby angles that 
+    pass through its ends. 
+    
+    returns up to max_lines Line objects ordered by votes. Each line is anchored 
+    at the median position of the points that voted for it, so the anchor is 
+    a sensible centerpoint to seed a LineCaster with."""
+    xy = np.asarray(points, dtype=float)[:, :2]
+    if not len(xy):
+        return []
+    accumulator, thetas, rhos = hough_accumulator(xy, n_thetas, rho_resolution)
+    unclaimed = np.ones(len(xy), dtype=bool)
+
+    lines = []
+    while len(lines) < max_lines:
+        t, r = np.unravel_index(np.argmax(accumulator), accumulator.shape)
+        if accumulator[t, r] < min_votes:
+            break
+
+        normal = np.array([np.cos(thetas[t]), np.sin(thetas[t])])
+        direction = np.array([-normal[1], normal[0]])
+        support = unclaimed & (np.abs(xy @ normal - rhos[r]) <= rho_resolution)
+        if support.any():
+            along = np.median(xy[support] @ direction)
+            x, y = along * direction + rhos[r] * normal
+            lines.append(Line({"x": x, "y": y, "theta": thetas[t] + np.pi/2}, points))
+
+        #remove the peak's influence. theta wraps around at pi, where 
+        #the same line comes back with its rho negated 
+        accumulator -= _vote(xy[support], thetas, rhos, rho_resolution)
+        unclaimed &= ~support
+        rows = np.arange(t - suppression[0] // 2, t + suppression[0] // 2 + 1)
+        wrapped = (rows < 0) | (rows >= n_thetas)
+        mirrored = int(np.rint((-rhos[r] - rhos[0]) / rho_resolution))
+        for center, theta_window in [(r, rows[~wrapped]), (mirrored, rows[wrapped] % n_thetas)]:
+            rho_window = slice(max(center - suppression[1] // 2, 0), center + suppression[1] // 2 + 1)
+            accumulator[theta_window, rho_window] = 0
+    return lines
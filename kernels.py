@@ -0,0 +1,221 @@
+"""The pipeline's sequential inner loops, compiled with numba when it's
+installed.
+
+Every kernel has a python/numpy version, used when numba isn't there,
+and a numba version written for it, with plain loops over arrays. Both 
+give identical results. The versions picked at import time are the
+module's public names, and python_* / numba_* stay available for
+benchmarking. Set NO_NUMBA=1 to skip importing numba and use the 
+fallbacks anyway.
+
+numba takes a while to import, so the modules using these kernels import
+this module the first time they need it."""
+import os
+import numpy as np
+
+numba = None
+if not os.environ.get("NO_NUMBA"):
+    try:
+        import numba
+    except ImportError:
+        pass
+
+USE_NUMBA = numba is not None
+
+#number of set bits in every possible byte
+BIT_COUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+def python_longest_path(start, indptr, indices, included):
+    """the longest path of distinct points from start through a graph stored
+    as compressed rows, like WallGrower._order_segments_from finds it.
+
+    included marks points the path can't visit, and is left as it was. 
+    Like the recursive version, start isn't marked, so a path may come 
+    back to it once. Neighbors are tried in the order indices lists them, 
+    and of equally long paths the first one found wins.
+
+    The search is depth first with an explicit stack, so long walls can't
+    hit the recursion limit. It runs on lists, which are faster than 
+    arrays one element at a time."""
+    indptr, indices, included = indptr.tolist(), indices.tolist(), included.tolist()
+    path = [start]
+    cursors = [indptr[start]]
+    best = []
+    while path:
+        node = path[-1]
+        if len(path) > len(best):
+            best = list(path)
+
+        #step to the next neighbor not on the path yet, or back up
+        cursor, end = cursors[-1], indptr[node + 1]
+        while cursor < end and included[indices[cursor]]:
+            cursor += 1
+        if cursor < end:
+            option = indices[cursor]
+            cursors[-1] = cursor + 1
+            included[option] = True
+            path.append(option)
+            cursors.append(indptr[option])
+        else:
+            if len(path) > 1:
+                included[node] = False
+            path.pop()
+            cursors.pop()
+    return np.array(best, dtype=np.int64)
+
+def _numba_longest_path(start, indptr, indices, included):
+    """python_longest_path on arrays, restoring included before returning"""
+    n_slots = len(included) + 2
+    path = np.empty(n_slots, dtype=np.int64)
+    cursor = np.empty(n_slots, dtype=np.int64)
+    best = np.empty(n_slots, dtype=np.int64)
+    best_length = 0
+    depth = 0
+    path[0] = start
+    cursor[0] = indptr[start]
+    while depth >= 0:
+        node = path[depth]
+        if depth + 1 > best_length:
+            best_length = depth + 1
+            best[:best_length] = path[:best_length]
+
+        advanced = False
+        while cursor[depth] < indptr[node + 1]:
+            option = indices[cursor[depth]]
+            cursor[depth] += 1
+            if not included[option]:
+                included[option] = True
+                depth += 1
+                path[depth] = option
+                cursor[depth] = indptr[option]
+                advanced = True
+                break
+        if not advanced:
+            if depth > 0:
+                included[node] = False
+            depth -= 1
+    return best[:best_length].copy()
+
+def python_coverage_scores(coverage, solutions, chunk_size=1024):
+    """the number of points explained by at least one line of each row of 
+    line indexes in solutions. coverage is the (lines, bytes) packbits of 
+    which points each line explains. Solutions are combined chunk_size at 
+    a time, to bound the memory used."""
+    scores = np.empty(len(solutions), dtype=np.int64)
+    for start in range(0, len(solutions), chunk_size):
+        chunk = solutions[start:start + chunk_size]
+        explained = np.bitwise_or.reduce(coverage[chunk], axis=1)
+        scores[start:start + chunk_size] = BIT_COUNTS[explained].sum(axis=1)
+    return scores
+
+def _numba_coverage_scores(coverage, solutions, chunk_size=1024):
+    """python_coverage_scores one solution at a time, so the combined
+    coverage of a solution never leaves the cache. chunk_size is unused"""
+    scores = np.empty(len(solutions), dtype=np.int64)
+    explained = np.empty(coverage.shape[1], dtype=np.uint8)
+    for s in range(len(solutions)):
+        explained[:] = coverage[solutions[s, 0]]
+        for line in solutions[s, 1:]:
+            for b in range(len(explained)):
+                explained[b] |= coverage[line, b]
+        total = 0
+        for b in range(len(explained)):
+            total += BIT_COUNTS[explained[b]]
+        scores[s] = total
+    return scores
+
+def python_spread_angles(thetas, skip, min_resolution):
+    """which thetas to try, going in order and leaving out any within
+    min_resolution of one already kept, or marked in skip. Tried angles
+    are kept sorted so each check is a binary search."""
+    from bisect import bisect_left, insort
+    keep = np.zeros(len(thetas), dtype=bool)
+    tried = []
+    for i, theta in enumerate(thetas.tolist()):
+        if skip[i]:
+            continue
+        slot = bisect_left(tried, theta)
+        if slot < len(tried) and tried[slot] - theta < min_resolution:
+            continue
+        if slot > 0 and theta - tried[slot - 1] < min_resolution:
+            continue
+        insort(tried, theta)
+        keep[i] = True
+    return keep
+
+def _numba_spread_angles(thetas, skip, min_resolution):
+    keep = np.zeros(len(thetas), dtype=np.bool_)
+    tried = np.empty(len(thetas))
+    n_tried = 0
+    for i in range(len(thetas)):
+        if skip[i]:
+            continue
+        close = False
+        for j in range(n_tried):
+            if abs(tried[j] - thetas[i]) < min_resolution:
+                close = True
+                break
+        if not close:
+            tried[n_tried] = thetas[i]
+            n_tried += 1
+            keep[i] = True
+    return keep
+
+def python_count_close(xy, indexes, starts, counts, order, distance, limit):
+    """how many points are within distance of each of the indexed points 
+    of xy, counting only up to limit. The candidates of point i are the 
+    runs order[starts[i, c]:starts[i, c] + counts[i, c]], one for each 
+    nearby grid cell c, like _Grid.nearby_cells finds them. 
+    
+    Every (point, candidate) pair is expanded into flat arrays and 
+    measured at once."""
+    n_cells = starts.shape[1]
+    starts, counts = starts.ravel(), counts.ravel()
+    occupied = counts > 0
+    starts, counts = starts[occupied], counts[occupied]
+    owners = np.repeat(np.repeat(np.arange(len(indexes)), n_cells)[occupied], counts)
+
+    #expand every (point, nearby cell) into one (point, candidate) pair per 
+    #point in the cell 
+    run_starts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    candidates = order[run_starts + np.arange(len(run_starts))]
+
+    origins = xy[indexes]
+    dx = xy[candidates, 0] - origins[owners, 0]
+    dy = xy[candidates, 1] - origins[owners, 1]
+    close = dx*dx + dy*dy <= distance**2
+    return np.minimum(np.bincount(owners[close], minlength=len(indexes)), limit)
+
+def _numba_count_close(xy, indexes, starts, counts, order, distance, limit):
+    """python_count_close one point at a time, moving on to the next point 
+    as soon as limit is reached"""
+    squared = distance * distance
+    result = np.zeros(len(indexes), dtype=np.int64)
+    for i in range(len(indexes)):
+        x, y = xy[indexes[i], 0], xy[indexes[i], 1]
+        n_close = 0
+        for c in range(starts.shape[1]):
+            for slot in range(starts[i, c], starts[i, c] + counts[i, c]):
+                dx = xy[order[slot], 0] - x
+                dy = xy[order[slot], 1] - y
+                if dx*dx + dy*dy <= squared:
+                    n_close += 1
+            if n_close >= limit:
+                n_close = limit
+                break
+        result[i] = n_close
+    return result
+
+if numba is not None:
+    numba_longest_path = numba.njit(cache=True)(_numba_longest_path)
+    numba_coverage_scores = numba.njit(cache=True)(_numba_coverage_scores)
+    numba_spread_angles = numba.njit(cache=True)(_numba_spread_angles)
+    #nogil, so chunks of points can be counted on several threads
+    numba_count_close = numba.njit(cache=True, nogil=True)(_numba_count_close)
+
+if USE_NUMBA:
+    longest_path, coverage_scores, spread_angles = numba_longest_path, numba_coverage_scores, numba_spread_angles
+    count_close = numba_count_close
+else:
+    longest_path, coverage_scores, spread_angles = python_longest_path, python_coverage_scores, python_spread_angles
+    count_close = python_count_close
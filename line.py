@@ -1,7 +1,7 @@
 import numpy as np
 from copy import deepcopy 
-from scipy.stats import norm
 from random import choice
+from pointcloud import Pointcloud
 
 def line_point_distance(line, point):
     """Calculate minimum euclidean distance from line to point"""
@@ -12,6 +12,104 @@ def line_point_distance(line, point):
     x2, y2 = (line.params["x"] + np.cos(line.params["theta"]), line.params["y"] + np.sin(line.params["theta"]))
     return np.abs((y2-y1)*x0 - (x2-x1)*y0 + x2*y1 - y2*x1)/np.sqrt((y2-y1)**2 + (x2-x1)**2)
 
+def line_point_distances(line, points):
+    """Calculate minimum euclidean distance from line to every point 
+    in an (n, 2) array at once"""
+    #project the offset from the line's anchor onto the line's normal
+    theta = line.params["theta"]
+    dx = points[:, 0] - line.params["x"]
+    dy = points[:, 1] - line.params["y"]
+    return np.abs(dy*np.cos(theta) - dx*np.sin(theta))
+
+def principal_axis(xy):
+    """the centroid of an (n, 2) array and the angle of its axis of
+    greatest variance, which is the line with the least total squared
+    orthogonal distance to the points"""
+    centroid = xy.mean(axis=0)
+    dx, dy = (xy - centroid).T
+
+    #the principal axis of a 2x2 covariance matrix has a closed form, 
+    #so we never need to build or decompose anything bigger
+    theta = .5 * np.arctan2(2 * np.dot(dx, dy), np.dot(dx, dx) - np.dot(dy, dy))
+    return centroid, theta
+
+def _ragged(neighborhoods):
+    """concatenate a list of index arrays. Returns the indexes, which 
+    neighborhood each came from, and every neighborhood's start and size"""
+    counts = np.array([len(n) for n in neighborhoods], dtype=np.intp)
+    indexes = np.concatenate([np.asarray(n, dtype=np.intp) for n in neighborhoods]) if len(neighborhoods) else np.empty(0, dtype=np.intp)
+    segments = np.repeat(np.arange(len(counts)), counts)
+    return indexes, segments, np.cumsum(counts) - counts, counts
+
+def _ragged_medians(values, segments, starts, counts):
+    """the median of each neighborhood's values, nan for empty ones"""
+    medians = np.full(len(counts), np.nan)
+    full = counts > 0
+    ordered = values[np.lexsort((values, segments))]
+    low = starts[full] + (counts[full] - 1) // 2
+    high = starts[full] + counts[full] // 2
+    medians[full] = (ordered[low] + ordered[high]) / 2
+    return medians
+
+def batch_fit_odr(points, neighborhoods):
+    """Line.fit_odr for many subsets of points at once, like every line 
+    caster's neighborhood in a population. neighborhoods is a list of 
+    index arrays into points. 
+
+    returns an (n, 3) array of x, y, theta rows, nan for neighborhoods 
+    of fewer than 2 points"""
+    indexes, segments, _, counts = _ragged(neighborhoods)
+    xy = np.asarray(points, dtype=float)[indexes, :2] if len(indexes) else np.empty((0, 2))
+    n = len(counts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        centroids = np.column_stack([np.bincount(segments, xy[:, k], minlength=n) for k in range(2)]) / counts[:, None]
+    dx, dy = (xy - centroids[segments]).T
+
+    #the same closed form as principal_axis, with sums per neighborhood
+    sxx = np.bincount(segments, dx * dx, minlength=n)
+    syy = np.bincount(segments, dy * dy, minlength=n)
+    sxy = np.bincount(segments, dx * dy, minlength=n)
+    fits = np.column_stack([centroids, .5 * np.arctan2(2 * sxy, sxx - syy)])
+    fits[counts < 2] = np.nan
+    return fits
+
+def batch_fit_theil_sen(points, neighborhoods, n_pairs=1000):
+    """Line.fit_theil_sen for many subsets of points at once, see 
+    batch_fit_odr. Every neighborhood gets n_pairs random pairs, even 
+    small ones that fit_theil_sen would use every pair of, so memory 
+    is O(neighborhoods * n_pairs).
+
+    returns an (n, 3) array of x, y, theta rows, nan for neighborhoods 
+    without two distinct points"""
+    indexes, segments, starts, counts = _ragged(neighborhoods)
+    xy = np.asarray(points, dtype=float)[indexes, :2] if len(indexes) else np.empty((0, 2))
+    thetas = np.full(len(counts), np.nan)
+
+    #one row of pairs for each neighborhood that has any
+    rows = np.nonzero(counts >= 2)[0]
+    i = starts[rows, None] + (np.random.rand(len(rows), n_pairs) * counts[rows, None]).astype(np.intp)
+    j = starts[rows, None] + (np.random.rand(len(rows), n_pairs) * counts[rows, None]).astype(np.intp)
+    deltas = xy[j] - xy[i]
+    angles = np.arctan2(deltas[..., 1], deltas[..., 0])
+    distinct = np.any(deltas != 0, axis=2) #drop duplicate points
+    has_pairs = distinct.any(axis=1)
+    rows, angles, distinct = rows[has_pairs], angles[has_pairs], distinct[has_pairs]
+
+    #center each row on its circular mean before taking the median, 
+    #like fit_theil_sen does
+    n_distinct = distinct.sum(axis=1)
+    reference = .5 * np.arctan2((np.sin(2 * angles) * distinct).sum(axis=1) / n_distinct, 
+        (np.cos(2 * angles) * distinct).sum(axis=1) / n_distinct)
+    centered = np.where(distinct, (angles - reference[:, None] + np.pi/2) % np.pi - np.pi/2, np.nan)
+    thetas[rows] = reference + np.nanmedian(centered, axis=1)
+
+    #position each line with medians along and across it
+    direction = np.column_stack([np.cos(thetas), np.sin(thetas)])
+    normal = np.column_stack([-np.sin(thetas), np.cos(thetas)])
+    along = _ragged_medians(np.einsum("pk,pk->p", xy, direction[segments]), segments, starts, counts)
+    across = _ragged_medians(np.einsum("pk,pk->p", xy, normal[segments]), segments, starts, counts)
+    return np.column_stack([along[:, None] * direction + across[:, None] * normal, thetas])
+
 class Line(object):
     """Represent a line and a pointcloud for the line. Provide 
     methods for fitting a line to the pointcloud and quantifying
@@ -19,21 +117,73 @@ class Line(object):
     
     A line is stored as x, y, and theta under the params object."""
 
-    def __init__(self, params, pointcloud):
+    def __init__(self, params, pointcloud, indexes=None):
         """Save the line parameters, as well as a scale factor to use on the 
-        euclidean distance every time it is calculated. """
+        euclidean distance every time it is calculated. 
+        
+        If indexes is passed, the line's points are just those points of 
+        the pointcloud, which can then be shared between many lines."""
         self.params = params
         self.pointcloud = pointcloud
+        self.indexes = indexes
+
+        #distances from the line to every point, shared by all the 
+        #score methods. See _calc_point_distances 
+        self._distances = None
+        self._distances_key = None
     
     def fit_odr(self):
-        """Orthogonal distance regress the line"""
-        #what is the cost function? total squared error? 
-        pass 
+        """Orthogonal distance regress the line. 
+        
+        The cost function is the total squared orthogonal distance, 
+        which is minimized by passing the line through the centroid 
+        along the axis of greatest variance."""
+        xy = self._point_array()
+        if len(xy) < 2:
+            return 
+        centroid, theta = principal_axis(xy)
+        self.params["x"], self.params["y"] = centroid
+        self.params["theta"] = theta
 
-    def fit_theil_sen(self):
+    def fit_theil_sen(self, n_pairs=1000):
         """fit a theil sen estimator, modified 
-        to use orthogonal distance"""
-        pass 
+        to use orthogonal distance. 
+        
+        Theta is the median angle of the lines through pairs of points, 
+        and the line is placed at the median orthogonal offset of the points. 
+        Instead of every pair, at most n_pairs random pairs are used, so 
+        memory stays O(n) instead of O(n^2)."""
+        xy = self._point_array()
+        n = len(xy)
+        if n < 2:
+            return 
+
+        #small pointclouds can afford the exact estimator
+        if n * (n - 1) // 2 <= n_pairs:
+            i, j = np.triu_indices(n, k=1)
+        else:
+            i = np.random.randint(0, n, n_pairs)
+            j = np.random.randint(0, n, n_pairs)
+        deltas = xy[j] - xy[i]
+        deltas = deltas[np.any(deltas != 0, axis=1)] #drop duplicate points
+        if not len(deltas):
+            return 
+
+        #a line pointing at theta is the same as one pointing at theta + pi, 
+        #so angles live on a circle of circumference pi. Center them on their 
+        #circular mean before taking the median so it can't straddle the wraparound
+        angles = np.arctan2(deltas[:, 1], deltas[:, 0])
+        reference = .5 * np.arctan2(np.sin(2 * angles).mean(), np.cos(2 * angles).mean())
+        centered = (angles - reference + np.pi/2) % np.pi - np.pi/2
+        theta = reference + np.median(centered)
+
+        #position the line with medians along and across it 
+        direction = np.array([np.cos(theta), np.sin(theta)])
+        normal = np.array([-np.sin(theta), np.cos(theta)])
+        along = np.median(xy @ direction)
+        across = np.median(xy @ normal)
+        self.params["x"], self.params["y"] = along * direction + across * normal
+        self.params["theta"] = theta
 
     def fit_p2p(self, cf, n_attempts=10):
         """fit_p2p fits a line by repeatedly selecting a point
@@ -78,11 +228,12 @@ class Line(object):
 
     def score_OLS_ODR(self):
         """total of squares of orthodonal distances"""
-        pass 
+        distances = self._calc_point_distances()
+        return np.dot(distances, distances)
 
     def score_LAD_ODR(self):
         """total of orthogonal distances"""
-        pass 
+        return np.sum(self._calc_point_distances())
 
     def score_chute_length(self, chute_radius=.5, chute_check_resolution=.25, min_chute_region_pop=1):
         """length a sphere can travel along the line until the amount of points found in the sphere falls 
@@ -95,11 +246,57 @@ class Line(object):
         """ return total of (1 - norm.cdf(distance*self.distance_scale)) for every point
         
         Returned as a negative number. """
-        chance = 1 - 1
-        pass
+        #ndtr is norm.cdf, without importing all of scipy.stats
+        from scipy.special import ndtr
+        chance = 1 - ndtr(self._calc_point_distances() * distance_scale)
+        return -np.sum(chance)
 
     def _calc_point_distances(self):
-        """ determine the distance from every point to every line """
+        """ determine the distance from every point to the line. 
+        
+        The result is cached and only recalculated when the params 
+        or the pointcloud have changed since the last call, so comparing 
+        several score methods on one line only measures distances once. """
+        key = self._distances_cache_key()
+        if key != self._distances_key:
+            self._distances = line_point_distances(self, self._point_array())
+            self._distances_key = key
+        return self._distances
+
+    def _distances_cache_key(self):
+        """everything the point distances depend on. params is a dict 
+        that gets edited in place, so its values are copied into the key. 
+        Pointcloud objects bump their version whenever their points change. 
+        A plain list can't tell, see points_changed"""
+        return (
+            self.params["x"], self.params["y"], self.params["theta"], 
+            id(self.pointcloud), getattr(self.pointcloud, "version", None), id(self.indexes))
+
+    def points_changed(self):
+        """forget the cached distances. Only needed after editing a plain 
+        list of points in place, a Pointcloud keeps track by itself"""
+        self._distances_key = None
+
+    def _point_array(self):
+        """the x and y columns of the line's pointcloud as an array. The 
+        pointcloud can be a list of points or a Pointcloud object.
+
+        Only the line's own points are copied: a Pointcloud converts a list 
+        to an array once for every line sharing it, and from a plain list 
+        the points at indexes are picked out one by one."""
+        if isinstance(self.pointcloud, Pointcloud):
+            if not len(self.pointcloud.points):
+                return np.empty((0, 2))
+            points = self.pointcloud.as_array()
+            if self.indexes is not None:
+                points = points[self.indexes]
+        elif self.indexes is not None:
+            points = np.array([self.pointcloud[i][:2] for i in self.indexes], dtype=float).reshape(-1, 2)
+        else:
+            if not len(self.pointcloud):
+                return np.empty((0, 2))
+            points = np.asarray(self.pointcloud, dtype=float)
+        return points[:, :2]
 
     def _theta_subtract(self, theta):
         """Minimum possible radian value of the roation between the passed angles. """
@@ -112,34 +309,110 @@ class Line(object):
         return min(difference_a, difference_b)
 
 
+class LineCaster(object):
+    def __init__(self, pointcloud, indexes, centerpoint=None):
+        """A linecaster holds a line centerpoint and line angle, and 
+        the indexes of the points around it in a shared pointcloud. 
+        The line angle is chosen to maximize the amount of points 
+        the line explains. """
+        self.pointcloud = pointcloud
+        self.indexes = np.asarray(indexes, dtype=np.intp)
+        if centerpoint is None:
+            centerpoint = self.pointcloud.points[choice(self.indexes)]
+        self.centerpoint = centerpoint
+
+        #there's probably a way to do this analytically or with autodiff, 
+        #but a one dimensional search is fast already
+        self._try_pointing_at_every_point()
+
+    def _try_pointing_at_every_point(self, min_theta_resolution=.05):
+        """Local search method of collection of angles that point at 
+        points in the pointcloud. """
+        #because we did the kmeans centroid clustering, 
+        #a lot of our points are in straight lines. 
+        #walls will pass through all those points, 
+        #so when searching for the best theta we can 
+        #set theta based on other points. 
+        best_found_theta = 0
+        best_found_score = 0
+
+        #create line object 
+        self.line = Line({"x": self.centerpoint[0], "y": self.centerpoint[1], "theta": 0}, 
+            self.pointcloud, self.indexes)
+
+        #the angle from the centerpoint to every point in the neighborhood, 
+        #skipping the centerpoint itself
+        points = self.pointcloud.take(self.indexes).reshape(len(self.indexes), -1)
+        skip = np.isclose(points[:, :2], self.centerpoint[:2]).all(axis=1)
+        thetas = np.arctan2(points[:, 1] - self.centerpoint[1], points[:, 0] - self.centerpoint[0])
+
+        #leave out angles too similar to one that's already been tried
+        from kernels import spread_angles
+        for theta in thetas[spread_angles(thetas, skip, min_theta_resolution)]:
+            #test this line against the best found line. score_total_norm_cdf 
+            #is negative, the likelihood of the points is its opposite 
+            self.line.params["theta"] = theta 
+            score = -self.line.score_total_norm_cdf()
+            if score > best_found_score:
+                best_found_score = score 
+                best_found_theta = theta 
+        self.score = best_found_score
+        self.line.params["theta"] = best_found_theta
+
+
 class LCPopulation(object):
     """Store a collection of lines and a pointcloud.
     
     Each line also stores a pointcloud. The lines pointcloud 
-    can be a subset of this larger pointcloud, or the whole thing."""
+    can be a subset of this larger pointcloud, or the whole thing. 
+    Subsets are stored as index arrays into the shared pointcloud, 
+    never as copies of the points."""
 
-    def __init__(self, points):
-        """points should be a list of points."""
-        self.points = points 
-        self.pointcloud = Pointcloud(points, local_neighborhood_radius) 
-        self.lines = []
+    def __init__(self, points, local_neighborhood_radius=.4):
+        """points should be a list or array of points. They're turned 
+        into an array once here, which every line caster shares."""
+        self.points = np.asarray(points, dtype=float)
+        self.pointcloud = Pointcloud(self.points)
+        self.local_neighborhood_radius = local_neighborhood_radius
+        self.linecasters = []
 
-    def add_random(self, n, subset_radius):
+    def add_random(self, n, subset_radius=None):
         """ add n random points using samples from the 
         pointcloud as centerpoints, with the line pointclouds
         the subset of points within subset_radius of this point. """
+        if subset_radius is None:
+            subset_radius = self.local_neighborhood_radius
+
+        #select the points the lines will pass through
+        centerpoints = self.pointcloud.take(np.random.randint(0, len(self.points), n))
+
+        #get the points close to each of them in one batched query
+        neighborhoods = self.pointcloud.query_ball_points_indexes(centerpoints, subset_radius)
+
         #now fill in the population of optimized lines
-        for _ in range(n):
-            #select a point the line will pass through
-            point = choice(points)
-            
-            #get the points close to this point 
-            close_points = self.pointcloud.query_ball_point(point)
-            
-            self.lines.append(LineCaster(close_points, point))
+        for centerpoint, indexes in zip(centerpoints, neighborhoods):
+            self.linecasters.append(LineCaster(self.pointcloud, indexes, centerpoint))
                  
+    def fit_odr(self):
+        """refit every line caster's line to its neighborhood with 
+        batch_fit_odr. The casters' scores are from before the refit"""
+        self._apply_fits(batch_fit_odr(self.pointcloud.as_array(), [lc.indexes for lc in self.linecasters]))
+
+    def fit_theil_sen(self, n_pairs=1000):
+        """refit every line caster's line to its neighborhood with 
+        batch_fit_theil_sen. The casters' scores are from before the refit"""
+        self._apply_fits(batch_fit_theil_sen(self.pointcloud.as_array(), 
+            [lc.indexes for lc in self.linecasters], n_pairs))
+
+    def _apply_fits(self, fits):
+        """copy x, y, theta rows into the casters' lines, skipping the 
+        lines that couldn't be fit"""
+        for lc, (x, y, theta) in zip(self.linecasters, fits.tolist()):
+            if np.isfinite(theta):
+                lc.line.params.update({"x": x, "y": y, "theta": theta})
+
     def reassign_points(self):
         """Assign every point in the pointcloud to the closest
         line, then replace each line's pointcloud with its assigned 
         points."""
-        pass
\ No newline at end of file
+        pass
@@ -0,0 +1,86 @@
+from genetic_optimizer import line_point_distance_matrix
+import numpy as np
+import time
+
+class LocalSearchSelector(object):
+    def __init__(self, linecasters, pointcloud, lines_in_sol=10, local_neighborhood_radius=.04, 
+            candidates_per_move=16, start_temperature=2., end_temperature=.05):
+        """Set up a simulated annealing search over a single solution. 
+        
+        This is a low latency alternative to GASelector with the same 
+        best_solution. A move swaps one line of the solution for another. 
+        Because the number of lines explaining each point is kept up to date, 
+        a swap's change in score only takes one pass over the points, instead 
+        of rescoring a whole solution like the GA does for every child."""
+        self.linecasters = linecasters 
+        self.pointcloud = pointcloud 
+        self.local_neighborhood_radius = local_neighborhood_radius
+        self.candidates_per_move = candidates_per_move
+        self.start_temperature = start_temperature
+        self.end_temperature = end_temperature
+
+        self.matrix = line_point_distance_matrix(self.linecasters, self.pointcloud)
+        self.coverage = self.matrix < self.local_neighborhood_radius
+        self.n_lines = len(self.coverage)
+
+        self._greedy_start(lines_in_sol)
+        self.best_lines = self.solution.copy()
+        self.best_score = self.score
+
+    def _greedy_start(self, lines_in_sol):
+        """start from the solution made by repeatedly adding the line 
+        that explains the most unexplained points"""
+        self.counts = np.zeros(self.coverage.shape[1], dtype=np.int64)
+        self.solution = np.zeros(lines_in_sol, dtype=np.int64)
+        for slot in range(lines_in_sol):
+            gains = np.count_nonzero(self.coverage & (self.counts == 0), axis=1)
+            self.solution[slot] = np.argmax(gains)
+            self.counts += self.coverage[self.solution[slot]]
+        self.score = int(np.sum(self.counts > 0))
+
+    def run_iter(self, temperature=None):
+        """try swapping a random line of the solution for the best of 
+        candidates_per_move random lines. Improvements are always kept, 
+        and a swap that loses d points is kept with probability 
+        exp(-d / temperature)."""
+        if temperature is None:
+            temperature = self.end_temperature
+        slot = np.random.randint(len(self.solution))
+        removed = self.solution[slot]
+        candidates = np.random.randint(0, self.n_lines, self.candidates_per_move)
+
+        #the points only the removed line explains are lost, and 
+        #a candidate gains whatever is unexplained without it
+        counts_without = self.counts - self.coverage[removed]
+        lost = np.sum((self.counts > 0) & (counts_without == 0))
+        gained = np.count_nonzero(self.coverage[candidates] & (counts_without == 0), axis=1)
+        best = np.argmax(gained)
+        delta = int(gained[best] - lost)
+
+        if delta >= 0 or np.random.rand() < np.exp(delta / temperature):
+            self.solution[slot] = candidates[best]
+            self.counts = counts_without + self.coverage[candidates[best]]
+            self.score += delta
+            if self.score > self.best_score:
+                self.best_score = self.score
+                self.best_lines = self.solution.copy()
+
+    def run(self, time_budget=.05, max_iterations=None):
+        """anneal until time_budget seconds pass or max_iterations moves 
+        are made. The temperature falls geometrically from start_temperature 
+        to end_temperature over the budget."""
+        start = time.perf_counter()
+        iteration = 0
+        while True:
+            elapsed = time.perf_counter() - start
+            if elapsed >= time_budget or (max_iterations is not None and iteration >= max_iterations):
+                break
+            progress = elapsed / time_budget
+            if max_iterations is not None:
+                progress = max(progress, iteration / max_iterations)
+            self.run_iter(self.start_temperature * (self.end_temperature / self.start_temperature) ** progress)
+            iteration += 1
+        return iteration
+
+    def best_solution(self):
+        return {"lines": self.best_lines.tolist(), "score": int(self.best_score)}
@@ -0,0 +1,150 @@
+import numpy as np
+
+class MockedScene(object):
+    """A synthetic LIDAR frame and the walls it was sampled from. 
+
+    points are [x y z intensity ring_scan_number] in firing order, like a 
+    frame from DataLoader. walls is a (n, 4) array of [x0 y0 x1 y1] segments, 
+    and is_floor / is_outlier say where each point came from."""
+    def __init__(self, points, walls, is_floor, is_outlier):
+        self.points = points
+        self.walls = walls
+        self.is_floor = is_floor
+        self.is_outlier = is_outlier
+
+def room_walls(width=10, depth=6, notch=2, doorway=1, rotation=.3, center=(0, 0)):
+    """the walls of a rectangular room with one corner notched in, so the 
+    room has both convex and concave corners, and a doorway in the middle 
+    of the left wall. The room is rotated so no wall is vertical, which 
+    slope intercept lines can't represent. A notch or doorway of 0 leaves 
+    the room a plain rectangle."""
+    w, d, n, h = width / 2, depth / 2, notch, doorway / 2
+    #walk around the room from one side of the doorway to the other
+    corners = np.array([(-w, -h), (-w, -d), (w - n, -d), (w - n, -d + n), (w, -d + n), (w, d), (-w, d), (-w, h)], dtype=float)
+    if not doorway:
+        #without a doorway the walk goes back to the corner it started from
+        corners = np.vstack([corners[1:-1], corners[1:2]])
+    c, s = np.cos(rotation), np.sin(rotation)
+    corners = corners @ np.array([[c, s], [-s, c]]) + center
+    walls = np.hstack([corners[:-1], corners[1:]])
+    return walls[np.any(walls[:, :2] != walls[:, 2:], axis=1)]
+
+def wall_at(theta, center=(1, 2), length=10):
+    """the [x0 y0 x1 y1] wall of length through center, pointing at theta"""
+    offset = length / 2 * np.array([np.cos(theta), np.sin(theta)])
+    return np.concatenate([center - offset, center + offset])
+
+def sample_walls(walls, spacing=.05, noise=.01, n_outliers=0, height=None, seed=None):
+    """points every spacing along each [x0 y0 x1 y1] wall, with gaussian 
+    noise. A wall's own end is left out, so the walls of a room don't 
+    repeat their corners. n_outliers are scattered uniformly over the 
+    walls' bounding square and come last. 
+
+    The points are [x y], or [x y z] with z uniform between 0 and height 
+    when height is passed."""
+    rng = np.random.RandomState(seed)
+    walls = np.asarray(walls, dtype=float).reshape(-1, 4)
+    spans = walls[:, 2:] - walls[:, :2]
+    counts = np.rint(np.hypot(spans[:, 0], spans[:, 1]) / spacing).astype(np.int64)
+
+    #the position of every point along its wall, from 0 up to 1
+    owners = np.repeat(np.arange(len(walls)), counts)
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    xy = walls[owners, :2] + (steps / counts[owners])[:, None] * spans[owners]
+    xy += rng.normal(0, noise, xy.shape)
+    xy = np.vstack([xy, rng.uniform(walls.min(), walls.max(), (n_outliers, 2))])
+    if height is None:
+        return xy
+    return np.column_stack([xy, rng.uniform(0, height, len(xy))])
+
+def make_room(n_points=30000, n_rings=16, walls=None, sensor_height=.5, noise=.02, 
+        outlier_fraction=.02, max_elevation=15, ray_outliers=False, seed=None):
+    """cast a spinning LIDAR scan of n_points at the walls from the origin. 
+    
+    Rings fan out between -max_elevation and max_elevation degrees. The 
+    lower rings hit the floor (z = 0) before they reach a wall. The walls 
+    are sensor_height + 2 tall, rays that pass over them are dropped and 
+    replaced with outliers, along with outlier_fraction of the points, 
+    scattered uniformly through the room. With ray_outliers, that fraction 
+    instead stays on its own rays and is pulled toward the sensor, like 
+    returns off dust."""
+    rng = np.random.RandomState(seed)
+    if walls is None:
+        walls = room_walls()
+    n_azimuths = max(n_points // n_rings, 1)
+    azimuths = np.linspace(-np.pi, np.pi, n_azimuths, endpoint=False) + np.pi / n_azimuths
+    elevations = np.radians(np.linspace(-max_elevation, max_elevation, n_rings))
+
+    #intersect every azimuth's ray with every wall at once
+    directions = np.column_stack([np.cos(azimuths), np.sin(azimuths)])
+    starts, spans = walls[:, :2], walls[:, 2:] - walls[:, :2]
+    cross = lambda a, b: a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominators = cross(directions[:, None], spans[None])
+        distances = cross(starts[None], spans[None]) / denominators
+        along_wall = cross(starts[None], directions[:, None]) / denominators
+    hits = (distances > 0) & (along_wall >= 0) & (along_wall <= 1)
+    wall_distance = np.where(hits, distances, np.inf).min(axis=1)
+
+    #firing order is every ring at one azimuth, then the next azimuth
+    distance = np.repeat(wall_distance, n_rings)
+    elevation = np.tile(elevations, n_azimuths)
+    with np.errstate(divide="ignore"):
+        floor_distance = np.where(elevation < 0, sensor_height / np.tan(-elevation), np.inf)
+    is_floor = floor_distance < distance
+    distance = np.minimum(distance, floor_distance)
+    z = np.where(is_floor, 0, sensor_height + distance * np.tan(elevation))
+
+    azimuth = np.repeat(azimuths, n_rings)
+    points = np.column_stack([
+        distance * np.cos(azimuth), distance * np.sin(azimuth), z, 
+        rng.uniform(0, 255, len(z)), np.tile(np.arange(n_rings), n_azimuths)])
+    points[:, :3] += rng.normal(0, noise, (len(points), 3))
+
+    #rays that escaped over the walls become outliers
+    escaped = ~np.isfinite(distance) | (z > sensor_height + 2)
+    is_outlier = escaped | (rng.rand(len(points)) < outlier_fraction)
+    scattered = escaped if ray_outliers else is_outlier
+    pulled = is_outlier & ~scattered
+    points[pulled, :2] *= rng.uniform(.3, .8, (pulled.sum(), 1))
+    low, high = walls[:, :2].min() , walls[:, :2].max()
+    n_outliers = scattered.sum()
+    points[scattered, :2] = rng.uniform(low, high, (n_outliers, 2))
+    points[scattered, 2] = rng.uniform(0, sensor_height + 2, n_outliers)
+    is_floor &= ~is_outlier
+    return MockedScene(points, walls, is_floor, is_outlier)
+
+def line_endpoints(line):
+    """[x0 y0 x1 y1] of a bounded line, like ODR_Fit and TLS_Fit make"""
+    return np.array(list(line.start_point) + list(line.end_point), dtype=float)
+
+def score_walls(lines, walls, angle_tolerance=.1, distance_tolerance=.15):
+    """compare detected lines to the true walls. A line matches a wall when 
+    their angles are within angle_tolerance radians, both of the line's ends 
+    are within distance_tolerance of the wall's line, and the line's middle 
+    lies along the wall. 
+
+    returns precision, the fraction of lines matching a wall, and recall, 
+    the fraction of walls matched by a line"""
+    if not len(lines) or not len(walls):
+        return 0., 0.
+    segments = np.array([line_endpoints(l) for l in lines])
+    starts, spans = walls[:, :2], walls[:, 2:] - walls[:, :2]
+    lengths = np.hypot(spans[:, 0], spans[:, 1])
+    directions = spans / lengths[:, None]
+    normals = np.column_stack([-directions[:, 1], directions[:, 0]])
+
+    def offsets(points):
+        """(lines, walls) distances from points to each wall's line"""
+        return np.abs(np.einsum("lwk,wk->lw", points[:, None] - starts[None], normals))
+
+    close = (offsets(segments[:, :2]) < distance_tolerance) & (offsets(segments[:, 2:]) < distance_tolerance)
+    line_angles = np.arctan2(segments[:, 3] - segments[:, 1], segments[:, 2] - segments[:, 0])
+    wall_angles = np.arctan2(spans[:, 1], spans[:, 0])
+    angle_errors = np.abs((line_angles[:, None] - wall_angles[None] + np.pi/2) % np.pi - np.pi/2)
+    middles = (segments[:, :2] + segments[:, 2:]) / 2
+    along = np.einsum("lwk,wk->lw", middles[:, None] - starts[None], directions)
+    inside = (along > -distance_tolerance) & (along < lengths + distance_tolerance)
+
+    matches = close & (angle_errors < angle_tolerance) & inside
+    return matches.any(axis=1).mean(), matches.any(axis=0).mean()
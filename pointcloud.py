@@ -1,21 +1,46 @@
-from line import line_point_distance
-from scipy.spatial import KDTree
-from sklearn.cluster import MiniBatchKMeans, KMeans
+from range_image import RangeImage
 from random import random
 import numpy as np 
 
 class Pointcloud(object):
     def __init__(self, points):
-        self.points = points 
-        
         #fitting the kdtree is expensive, and only needed 
         #for the query ball tree method. 
         self.kdtree = {}
         self.kdtree_sync = False
 
+        #incremented every time the points change, so anything 
+        #derived from them (like a Line's distances) can tell it's stale
+        self.version = 0
+
+        #the points as an array, see as_array
+        self._array = None
+        self._array_version = None
+
+        self.points = points 
+
+    @property
+    def points(self):
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        #new points are always changed points
+        self._points = points
+        self._points_changed()
+
+    def _points_changed(self):
+        """mark everything derived from the points as out of date. 
+        Assigning to points does this, call it after editing them in place"""
+        self.kdtree_sync = False
+        self.version += 1
+
     def _ensure_kdtree_synced(self):
         """ensure kdtree is up to date """
         if not self.kdtree_sync:
+            #scipy and sklearn are imported where they're used, here and 
+            #in the other pipeline modules, so importing them costs just numpy
+            from scipy.spatial import KDTree
             self.kdtree = KDTree(self.points)
             self.kdtree_sync = True
     
@@ -25,51 +50,259 @@ class Pointcloud(object):
         close_point_indexes = self.kdtree.query_ball_point([point], radius)[0]
         return [self.points[i] for i in close_point_indexes]
 
+    def query_ball_point_indexes(self, point, radius):
+        """like query_ball_point, but return an integer array of 
+        indexes into self.points instead of copying the points"""
+        self._ensure_kdtree_synced()
+
+        return np.asarray(self.kdtree.query_ball_point(point, radius), dtype=np.intp)
+
+    def query_ball_points_indexes(self, points, radius, workers=1):
+        """query_ball_point_indexes for many points in one kdtree call. 
+        Returns a list with an index array for each point"""
+        self._ensure_kdtree_synced()
+
+        neighborhoods = self.kdtree.query_ball_point(points, radius, workers=workers)
+        return [np.asarray(indexes, dtype=np.intp) for indexes in neighborhoods]
+
+    def as_array(self):
+        """the points as a float array. When the points are a list they're
+        converted once, and the array is kept until the points change, 
+        like the kdtree. So edit the points through this class, not in place."""
+        if self.version != self._array_version:
+            self._array = np.asarray(self.points, dtype=float)
+            self._array_version = self.version
+        return self._array
+
+    def take(self, indexes):
+        """the points at indexes as an array. Fancy indexing can't return 
+        a view, so this copies the points taken (but never the whole 
+        pointcloud). Keep indexes around rather than the result"""
+        return self.as_array()[indexes]
+
+    def select(self, mask):
+        """keep only the points where mask is true"""
+        self.points = self.as_array()[mask]
+
+    def to_range_image(self, n_azimuths=1800):
+        """project the points onto a (ring, azimuth bin) grid. 
+        The ring column must not have been dropped by take_xy yet."""
+        return RangeImage(self.points, n_azimuths)
+
     def remove_floor(self, floor=.03):
         self.points = [p for p in self.points if p[2] > floor]
-        self.kdtree_sync = False
+
+    def remove_floor_plane(self, floor_plane, floor=.03):
+        """refit floor_plane, a FloorPlane carried over from the previous 
+        frame, to these points. Then drop points less than floor above it. 
+        Unlike remove_floor this follows slopes and sensor tilt."""
+        self.select(self._floor_plane_mask(floor_plane, floor))
+
+    def _floor_plane_mask(self, floor_plane, floor=.03):
+        """mask of the points more than floor above the refit floor_plane"""
+        if not floor_plane.fit(self.points):
+            return np.ones(len(self.points), dtype=bool)
+        return floor_plane.heights(self.points) > floor
 
     def take_percentage(self, percent=.1):
         """randomly prune points to get down to the passed percent"""
         self.points = [p for p in self.points if random() < percent]
-        self.kdtree_sync = False
 
     def take_xy(self):
         """lidar scans are [x y z intensity ring_scan_number]
         We normally only need x and y"""
         self.points = [[p[0], p[1]] for p in self.points]
-        self.kdtree_sync = False
 
     def take_centroids(self, n_means, exact=False):
         """ https://github.com/Dibillilia/AveragedClusterAugmenter """
+        from sklearn.cluster import MiniBatchKMeans, KMeans
         if not exact:
             clusterer = MiniBatchKMeans(n_clusters=n_means)
         else:
             clusterer = KMeans(n_clusters=n_means)
         clusterer = clusterer.fit(self.points)
         self.points = clusterer.cluster_centers_ #points is now a numpy array
-        self.kdtree_sync = False
 
-    def get_nearest_neighbors(self, k):
-        """return an array of arrays containing indexes of 
-        the nearest neighbors of the self.points array"""
+    def get_nearest_neighbors(self, k, distance_upper_bound=np.inf, workers=1, indexes=None):
+        """return an array of arrays containing distances and indexes of 
+        the nearest neighbors of the self.points array, or of just the 
+        points at indexes. 
+        
+        Neighbors further than distance_upper_bound are left out, which 
+        lets the kdtree prune its search. Their distance is infinite and 
+        their index is len(self.points). workers=-1 queries on every core."""
         self._ensure_kdtree_synced()
 
-        return self.kdtree.query(self.points, k)
+        points = self.kdtree.data if indexes is None else self.kdtree.data[indexes]
+        return self.kdtree.query(points, k, 
+            distance_upper_bound=distance_upper_bound, workers=workers)
+
+    def min_density_filter(self, n_neighbors, distance, workers=1, chunk_size=4096):
+        """remove points with fewer than n_neighbors points (counting themselves) 
+        within distance. See _min_density_mask"""
+        self.select(self._min_density_mask(n_neighbors, distance, workers, chunk_size))
+
+    def _min_density_mask(self, n_neighbors, distance, workers=1, chunk_size=4096):
+        """mask of the points with at least n_neighbors points (counting themselves) 
+        within distance. 
+        
+        Points are binned into a grid of cells with diagonal distance, so any 
+        two points sharing a cell are neighbors and only cells within two 
+        steps can hold neighbors. Most points are settled by counting the 
+        cells that lie wholly within distance of them. The rest are checked 
+        exactly against the points in the cells only partly within distance 
+        by kernels.count_close, in chunks of chunk_size points spread 
+        over workers threads (-1 uses every core). No kdtree is needed."""
+        keep = np.zeros(len(self.points), dtype=bool)
+        if len(self.points):
+            xy = self.as_array()[:, :2]
+            grid = _Grid(xy, distance / np.sqrt(2), reach=2)
+
+            #at least n_neighbors in the point's own cell means it's definitely kept
+            keep = grid.counts[grid.cell_of_point] >= n_neighbors
+
+            #cells entirely out of distance of a point are dropped, and cells 
+            #entirely within it add their whole population. If that can't 
+            #reach n_neighbors or already has, the point is settled
+            unsure = np.nonzero(~keep)[0]
+            starts, counts = grid.nearby_cells(unsure)
+            nearest, farthest = grid.nearby_distances(unsure)
+            counts = np.where(nearest <= distance**2, counts, 0)
+            whole = np.where(farthest <= distance**2, counts, 0)
+            counts -= whole
+            n_whole = whole.sum(axis=1)
+            keep[unsure] = n_whole >= n_neighbors
+            possible = ~keep[unsure] & (n_whole + counts.sum(axis=1) >= n_neighbors)
+            unsure, starts, counts, n_whole = unsure[possible], starts[possible], counts[possible], n_whole[possible]
+
+            #the exact check on the cells only partly within distance, which 
+            #stops counting a point's neighbors once it has n_neighbors
+            from kernels import count_close
+            chunks = [slice(i, i + chunk_size) for i in range(0, len(unsure), chunk_size)]
+            count_chunk = lambda chunk: count_close(xy, unsure[chunk], starts[chunk], counts[chunk], 
+                grid.order, distance, n_neighbors)
+            if workers == 1 or len(chunks) < 2:
+                n_close = [count_chunk(chunk) for chunk in chunks]
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(None if workers == -1 else workers) as executor:
+                    n_close = list(executor.map(count_chunk, chunks))
+            if chunks:
+                keep[unsure] = n_whole + np.concatenate(n_close) >= n_neighbors
+        return keep
+
+    def isolation_forest_filter(self, k=8, contamination="auto", model=None, n_jobs=None, workers=1):
+        """remove the points an isolation forest flags as outliers. 
+
+        Each point is described by the distances to its k nearest neighbors, 
+        which don't depend on where the robot is. So a model fit on one 
+        frame can be passed back in as model to filter later frames without 
+        refitting. n_jobs is passed to the forest, workers to the kdtree. 
+
+        returns the fitted model"""
+        mask, model = self._isolation_forest_mask(k, contamination, model, n_jobs, workers)
+        self.select(mask)
+        return model
 
-    def isolation_forest_filter(self):
-        pass 
+    def _isolation_forest_mask(self, k=8, contamination="auto", model=None, n_jobs=None, workers=1):
+        """mask of the points that aren't outliers, and the fitted model"""
+        features = self._neighbor_distances(k, workers)
+        if model is None:
+            from sklearn.ensemble import IsolationForest
+            model = IsolationForest(contamination=contamination, n_jobs=n_jobs).fit(features)
+        return model.predict(features) == 1, model
+
+    def statistical_outlier_filter(self, k=8, std_ratio=2., workers=1):
+        """remove points whose mean distance to their k nearest neighbors 
+        is more than std_ratio standard deviations above the average"""
+        self.select(self._statistical_outlier_mask(k, std_ratio, workers))
+
+    def _statistical_outlier_mask(self, k=8, std_ratio=2., workers=1):
+        """mask of the points statistical_outlier_filter keeps"""
+        mean_distances = self._neighbor_distances(k, workers).mean(axis=1)
+        limit = mean_distances.mean() + std_ratio * mean_distances.std()
+        return mean_distances <= limit
+
+    def _neighbor_distances(self, k, workers=1):
+        """(n, k) distances from every point to its k nearest neighbors, 
+        not counting itself"""
+        distances, _ = self.get_nearest_neighbors(k + 1, workers=workers)
+        return distances[:, 1:]
 
     def biased_undersample(self, percentile=.6, radius=.1):
         """Make all points have as many neighbors as the percentile's 
         amount of neighbors"""
+        self.select(self._biased_undersample_mask(percentile, radius))
+
+    def _biased_undersample_mask(self, percentile=.6, radius=.1):
+        """randomly keep points with more neighbors than the percentile's amount 
+        with probability percentile_neighbors/n_neighbors, and every other point"""
         self._ensure_kdtree_synced()
 
-        n_neighbors = [len(neighbors) for neighbors in self.kdtree.query_ball_point(self.points, radius)]
-        nn_index = list(enumerate(n_neighbors))
-        nn_index.sort(key=lambda x: x[1])
-        percentile_neighbors = nn_index[int(percentile * len(nn_index))][1]
-        selected_indexes = [nn_i[0] for nn_i in nn_index if nn_i[1] < percentile_neighbors or np.random.rand() < percentile_neighbors/nn_i[1]]
-        self.points = [self.points[i] for i in selected_indexes]
-        self.kdtree_sync = False
-        self.points
\ No newline at end of file
+        n_neighbors = self.kdtree.query_ball_point(self.kdtree.data, radius, return_length=True)
+        percentile_neighbors = np.sort(n_neighbors)[int(percentile * len(n_neighbors))]
+        return (n_neighbors < percentile_neighbors) | (np.random.rand(len(n_neighbors)) < percentile_neighbors/n_neighbors)
+
+
+class _Grid(object):
+    """A uniform grid over an (n, 2) array of points, with the points of 
+    each cell stored contiguously so cells can be looked up with array ops."""
+    def __init__(self, xy, cell_size, reach=1):
+        """reach is how many cells away a neighbor can be"""
+        self.xy = xy
+        self.cell_size = cell_size
+        self.reach = reach
+        cells = np.floor(xy / cell_size).astype(np.int64)
+        cells -= cells.min(axis=0) - reach
+        width = cells[:, 1].max() + reach + 1
+        self.keys = cells[:, 0] * width + cells[:, 1]
+        self.offsets = np.array([dx * width + dy 
+            for dx in range(-reach, reach + 1) for dy in range(-reach, reach + 1)])
+
+        #sorting once gives each cell's points a contiguous run of self.order
+        self.order = np.argsort(self.keys, kind="stable")
+        sorted_keys = self.keys[self.order]
+        new_cell = np.empty(len(sorted_keys), dtype=bool)
+        new_cell[:1] = True
+        np.not_equal(sorted_keys[1:], sorted_keys[:-1], out=new_cell[1:])
+        self.starts = np.nonzero(new_cell)[0]
+        self.unique_keys = sorted_keys[self.starts]
+        self.counts = np.diff(np.append(self.starts, len(sorted_keys)))
+        self.cell_of_point = np.empty(len(sorted_keys), dtype=np.int64)
+        self.cell_of_point[self.order] = np.cumsum(new_cell) - 1
+
+        #a table from every key to its cell makes lookups one index instead 
+        #of a binary search, when the grid is small enough to hold one 
+        n_keys = (cells[:, 0].max() + reach + 1) * width
+        self.slots = None
+        if n_keys <= 16 * len(xy):
+            self.slots = np.full(n_keys, -1, dtype=np.int64)
+            self.slots[self.unique_keys] = np.arange(len(self.unique_keys))
+
+    def nearby_cells(self, indexes):
+        """the start in self.order and the population of every cell 
+        within reach of each of the indexed points"""
+        nearby_keys = self.keys[indexes, None] + self.offsets
+        if self.slots is not None:
+            slots = self.slots[nearby_keys]
+            found = slots >= 0
+        else:
+            slots = np.clip(np.searchsorted(self.unique_keys, nearby_keys), 0, len(self.unique_keys) - 1)
+            found = self.unique_keys[slots] == nearby_keys
+        return self.starts[slots], np.where(found, self.counts[slots], 0)
+
+    def nearby_distances(self, indexes):
+        """the squared distance from each of the indexed points to the 
+        nearest point and to the farthest corner of every cell within 
+        reach, in the order of nearby_cells"""
+        #the gaps are worked out along each axis and added up
+        steps = np.arange(-self.reach, self.reach + 1)
+        inside = self.xy[indexes] / self.cell_size
+        inside -= np.floor(inside)
+        low = steps - inside[:, :, None]
+        nearest = np.maximum(np.maximum(low, -1 - low), 0)**2
+        farthest = np.maximum(-low, 1 + low)**2
+        shape = (len(low), len(steps)**2)
+        nearest = (nearest[:, 0, :, None] + nearest[:, 1, None, :]).reshape(shape)
+        farthest = (farthest[:, 0, :, None] + farthest[:, 1, None, :]).reshape(shape)
+        return nearest * self.cell_size**2, farthest * self.cell_size**2
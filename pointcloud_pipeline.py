@@ -0,0 +1,125 @@
+from pointcloud import Pointcloud
+import numpy as np
+
+class PointcloudPipeline(object):
+    """Record Pointcloud filters once, then run them on every frame in one 
+    fused pass. 
+
+    Calling a Pointcloud method copies the points each time. The pipeline 
+    instead: 
+        drops the columns no step will read before doing anything else 
+        combines consecutive filters that look at each point on its own 
+        (remove_floor, take_percentage) into a single boolean mask 
+        only applies that mask when a filter needs the points' neighbors, 
+        and builds the kdtree for it then 
+
+    Filter methods return the pipeline, so they can be chained: 
+
+        pipeline = PointcloudPipeline().remove_floor(.05).take_xy().take_percentage(.5)
+        pointcloud = pipeline.run(frame) """
+    def __init__(self):
+        #each step is (kind, columns, function). kind is one of 
+        #   "row": function(the columns) returns a mask, one point at a time 
+        #   "columns": the columns kept from here on 
+        #   "spatial": function(Pointcloud) returns a mask 
+        #   "replace": function(Pointcloud) returns new points 
+        self.steps = []
+
+    def remove_floor(self, floor=.03):
+        return self._add("row", [2], lambda z: z[:, 0] > floor)
+
+    def take_percentage(self, percent=.1):
+        return self._add("row", [], lambda none: np.random.rand(len(none)) < percent)
+
+    def take_xy(self):
+        return self._add("columns", [0, 1], None)
+
+    def remove_floor_plane(self, floor_plane, floor=.03):
+        return self._add("spatial", None, lambda pc: pc._floor_plane_mask(floor_plane, floor))
+
+    def min_density_filter(self, n_neighbors, distance, workers=1):
+        return self._add("spatial", None, lambda pc: pc._min_density_mask(n_neighbors, distance, workers))
+
+    def biased_undersample(self, percentile=.6, radius=.1):
+        return self._add("spatial", None, lambda pc: pc._biased_undersample_mask(percentile, radius))
+
+    def statistical_outlier_filter(self, k=8, std_ratio=2., workers=1):
+        return self._add("spatial", None, lambda pc: pc._statistical_outlier_mask(k, std_ratio, workers))
+
+    def isolation_forest_filter(self, k=8, contamination="auto", model=None, n_jobs=None, workers=1):
+        """the forest is fit on the first frame the pipeline runs on, 
+        unless model is passed, and reused for every frame after"""
+        models = [model]
+        def mask(pc):
+            keep, models[0] = pc._isolation_forest_mask(k, contamination, models[0], n_jobs, workers)
+            return keep
+        return self._add("spatial", None, mask)
+
+    def take_centroids(self, n_means, exact=False):
+        def centroids(pc):
+            pc.take_centroids(n_means, exact)
+            return pc.points
+        return self._add("replace", None, centroids)
+
+    def _add(self, kind, columns, function):
+        self.steps.append((kind, columns, function))
+        return self
+
+    def _needed_columns(self, n_columns):
+        """every column a step reads, plus the columns of the result. 
+
+        Raises ValueError if a step reads a column the frame doesn't have, 
+        or one that was dropped because only the visible columns of a 
+        replaced pointcloud are kept"""
+        visible = available = list(range(n_columns))
+        needed = set()
+        for i, (kind, columns, _) in enumerate(self.steps):
+            if kind in ["row", "columns"]:
+                missing = sorted(set(columns) - set(available))
+                if missing:
+                    raise ValueError("step %d reads columns %s, but only columns %s are left by then" % (
+                        i, missing, available))
+            if kind == "row":
+                needed.update(columns)
+            elif kind == "columns":
+                visible = columns
+            else:
+                needed.update(visible)
+                if kind == "replace":
+                    available = visible
+        return sorted(needed | set(visible))
+
+    def run(self, points):
+        """run every step on points, a frame of [x y z ...] points, and return 
+        the resulting Pointcloud"""
+        data = np.asarray(points, dtype=float)
+        visible = list(range(data.shape[1]))
+
+        #column projection goes first, so nothing else copies unused columns 
+        needed = self._needed_columns(data.shape[1])
+        data = data[:, needed]
+        position = {column: i for i, column in enumerate(needed)}
+
+        mask = None
+        for kind, columns, function in self.steps:
+            if kind == "row":
+                step_mask = function(data[:, [position[c] for c in columns]])
+                mask = step_mask if mask is None else mask & step_mask
+            elif kind == "columns":
+                visible = columns
+            else:
+                #neighbors are only meaningful after the pending mask is applied 
+                if mask is not None:
+                    data = data[mask]
+                    mask = None
+                pointcloud = Pointcloud(data[:, [position[c] for c in visible]])
+                if kind == "spatial":
+                    data = data[function(pointcloud)]
+                else:
+                    #replaced points only have the visible columns
+                    data = np.asarray(function(pointcloud), dtype=float)
+                    position = {column: i for i, column in enumerate(visible)}
+
+        if mask is not None:
+            data = data[mask]
+        return Pointcloud(data[:, [position[c] for c in visible]])
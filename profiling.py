@@ -0,0 +1,215 @@
+"""Opt-in timing of every stage of the frame pipeline.
+
+    profiler = Profiler()
+    with profiler:
+        ...run frames...
+    profiler.save("profile.json")
+
+Nothing is wrapped until a Profiler is enabled. Enabling swaps the
+instrumented methods on their classes for timing wrappers and disabling
+puts the originals back, so a disabled profiler costs nothing in the hot
+loop, not even a flag check."""
+from bisect import bisect_right
+from contextlib import contextmanager
+from functools import wraps
+import importlib
+import json
+import time
+
+#latency histogram buckets, BUCKETS_PER_DECADE to every factor of ten
+#from a microsecond to 100 seconds
+BUCKETS_PER_DECADE = 4
+BUCKET_EDGES = [10 ** (-6 + i / float(BUCKETS_PER_DECADE)) for i in range(8 * BUCKETS_PER_DECADE + 1)]
+
+def _length(value):
+    """len of value, or None if it has no length"""
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+#point counts in and out of a method. Each takes the instance, the
+#arguments and the result
+_points_before = lambda self, args, result: _length(self.points)
+_points_after = lambda self, args, result: _length(self.points)
+_pointcloud_points = lambda self, args, result: _length(self.pointcloud.points)
+_first_arg = lambda self, args, result: _length(args[0]) if args else None
+_result = lambda self, args, result: _length(result)
+_second_result = lambda self, args, result: _length(result[1])
+
+#(module, class, method, points in, points out) of everything instrumented.
+#points in is taken before the call and points out after it
+TARGETS = [
+    ("data_handler", "DataLoader", "load_next_frame", None, _result),
+] + [
+    ("pointcloud", "Pointcloud", name, _points_before, _points_after) for name in [
+        "remove_floor", "remove_floor_plane", "take_percentage", "take_xy", "take_centroids",
+        "min_density_filter", "isolation_forest_filter", "statistical_outlier_filter",
+        "biased_undersample"]
+] + [
+    ("wall_grower", "WallGrower", "make_network", _pointcloud_points, _second_result),
+    ("wall_grower", "WallGrower", "make_ransac_network", _pointcloud_points, _second_result),
+    ("wall_grower", "WallGrower", "_extract_subgroups", _first_arg, _result),
+    ("wall_grower", "WallGrower", "_arrange_into_line", _first_arg, _result),
+    ("wall_grower", "WallGrower", "_split_up_polylines", _first_arg, _result),
+    ("wall_grower", "WallGrower", "_fit_bounded_odr", _first_arg, None),
+    ("genetic_optimizer", "GASelector", "run_iter", None, None),
+]
+
+
+class Histogram(object):
+    """latencies counted into log spaced buckets, so a long run
+    takes constant memory"""
+    def __init__(self):
+        #one more bucket than edges, for anything past the last edge
+        self.counts = [0] * (len(BUCKET_EDGES) + 1)
+        self.n = 0
+        self.total = 0.
+        self.min = float("inf")
+        self.max = 0.
+
+    def add(self, seconds):
+        self.counts[bisect_right(BUCKET_EDGES, seconds)] += 1
+        self.n += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        """the upper edge of the bucket holding the q (0 to 1) quantile"""
+        if not self.n:
+            return None
+        target = q * self.n
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(BUCKET_EDGES[i] if i < len(BUCKET_EDGES) else self.max, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {"n": self.n, "total": self.total,
+            "mean": self.total / self.n if self.n else None,
+            "min": self.min if self.n else None, "max": self.max,
+            "p50": self.percentile(.5), "p90": self.percentile(.9), "p99": self.percentile(.99),
+            "bucket_edges": BUCKET_EDGES, "bucket_counts": self.counts}
+
+
+class StageStats(object):
+    """latencies and point counts of every call to one stage"""
+    def __init__(self):
+        self.latency = Histogram()
+        #None for stages that don't count points
+        self.points_in = None
+        self.points_out = None
+
+    def add(self, seconds, points_in=None, points_out=None):
+        self.latency.add(seconds)
+        if points_in is not None:
+            self.points_in = (self.points_in or 0) + points_in
+        if points_out is not None:
+            self.points_out = (self.points_out or 0) + points_out
+
+    def to_dict(self):
+        return {"calls": self.latency.n, "points_in": self.points_in,
+            "points_out": self.points_out, "latency": self.latency.to_dict()}
+
+
+class Profiler(object):
+    def __init__(self, targets=TARGETS):
+        """targets lists the methods to time, see TARGETS. Targets in
+        modules that can't be imported are skipped."""
+        self.targets = targets
+        self.stages = {}
+        self.kdtree_rebuilds = 0
+        self._originals = []
+
+    def enable(self):
+        if self._originals:
+            return
+        for module_name, class_name, method_name, count_in, count_out in self.targets:
+            try:
+                cls = getattr(importlib.import_module(module_name), class_name)
+            except ImportError:
+                continue
+            original = cls.__dict__[method_name]
+            self._originals.append((cls, method_name, original))
+            setattr(cls, method_name, self._wrap(class_name + "." + method_name,
+                original, count_in, count_out))
+
+        #kdtree builds are counted where they happen, in the sync check
+        #every query goes through
+        from pointcloud import Pointcloud
+        original = Pointcloud.__dict__["_ensure_kdtree_synced"]
+        self._originals.append((Pointcloud, "_ensure_kdtree_synced", original))
+        profiler = self
+        @wraps(original)
+        def ensure_kdtree_synced(pointcloud):
+            if pointcloud.kdtree_sync:
+                return original(pointcloud)
+            start = time.perf_counter()
+            original(pointcloud)
+            profiler.kdtree_rebuilds += 1
+            profiler.record("Pointcloud.kdtree_build", time.perf_counter() - start,
+                _length(pointcloud.points))
+        Pointcloud._ensure_kdtree_synced = ensure_kdtree_synced
+
+    def disable(self):
+        """put back the original methods"""
+        for cls, method_name, original in reversed(self._originals):
+            setattr(cls, method_name, original)
+        self._originals = []
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def _wrap(self, name, original, count_in, count_out):
+        profiler = self
+        @wraps(original)
+        def timed(instance, *args, **kwargs):
+            points_in = count_in(instance, args, None) if count_in else None
+            start = time.perf_counter()
+            result = original(instance, *args, **kwargs)
+            seconds = time.perf_counter() - start
+            points_out = count_out(instance, args, result) if count_out else None
+            profiler.record(name, seconds, points_in, points_out)
+            return result
+        return timed
+
+    def record(self, name, seconds, points_in=None, points_out=None):
+        if name not in self.stages:
+            self.stages[name] = StageStats()
+        self.stages[name].add(seconds, points_in, points_out)
+
+    @contextmanager
+    def stage(self, name):
+        """time a block of code that isn't one of the targets,
+        like a whole frame"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def to_dict(self):
+        return {"kdtree_rebuilds": self.kdtree_rebuilds,
+            "stages": {name: stats.to_dict() for name, stats in self.stages.items()}}
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def summary(self):
+        """one line per stage, slowest total first"""
+        lines = ["%-36s %7s %10s %10s %10s %10s" % ("stage", "calls", "total ms", "mean ms", "p90 ms", "points")]
+        for name, stats in sorted(self.stages.items(), key=lambda item: -item[1].latency.total):
+            latency = stats.latency
+            lines.append("%-36s %7d %10.2f %10.3f %10.3f %10s" % (name, latency.n, 1000 * latency.total,
+                1000 * latency.total / latency.n, 1000 * latency.percentile(.9),
+                "%s->%s" % (stats.points_in, stats.points_out)))
+        lines.append("kdtree rebuilds: %d" % self.kdtree_rebuilds)
+        return "\n".join(lines)
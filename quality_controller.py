@@ -0,0 +1,120 @@
+"""Keep frame processing inside a per frame time budget by trading away
+quality. See QualityController."""
+from contextlib import contextmanager
+import time
+
+class Knob(object):
+    """a quality setting the controller can turn down.
+
+    stages lists the names of the stages whose time grows with the 
+    value, each stage should belong to one knob. The value stays between 
+    low and high, and is rounded when integer is set."""
+    def __init__(self, name, value, low, high, stages, integer=False):
+        self.name = name
+        self.low = low
+        self.high = high
+        self.stages = stages
+        self.integer = integer
+
+        #the unrounded value, so small integers can still creep up
+        self.exact = value
+
+    @property
+    def value(self):
+        return int(round(self.exact)) if self.integer else self.exact
+
+    def scale(self, factor):
+        self.exact = min(max(self.exact * factor, self.low), self.high)
+
+
+def default_knobs():
+    """the knobs of wall_grower.process_frame, starting at the constants
+    the main loop used and never going above them"""
+    return [
+        Knob("percentage", .5, .05, .5, ["biased_undersample"]),
+        Knob("n_centroids", 400, 50, 400, ["take_centroids", "make_network", "linecasters"], integer=True),
+        Knob("n_generations", 20, 1, 20, ["ga_selector"], integer=True),
+    ]
+
+
+class QualityController(object):
+    def __init__(self, budget=.1, knobs=None, headroom=.9, max_step=(.5, 1.2), deadband=.05):
+        """budget is the seconds between frames, .1 for a 10 Hz LIDAR.
+
+        After every frame the knobs are all scaled by the same factor, 
+        picked so the frame would have taken headroom * budget if every 
+        stage's time is proportional to its knob. The factor is clipped to 
+        max_step so one odd frame can't wreck the quality, and changes 
+        within deadband of 1 are ignored. Frames
+        running late add to a debt, and a frame is skipped each time the
+        debt reaches a whole budget."""
+        self.budget = budget
+        self.knobs = default_knobs() if knobs is None else knobs
+        self.headroom = headroom
+        self.max_step = max_step
+        self.deadband = deadband
+
+        self.debt = 0.
+        self.frames = 0
+        self.skipped = 0
+        self.stage_times = {}
+        self.frame_start = None
+        self.last_frame_time = None
+
+    def settings(self):
+        """the current knob values by name"""
+        return {knob.name: knob.value for knob in self.knobs}
+
+    def should_skip(self):
+        """call once per incoming frame, before start_frame. True when
+        processing has fallen a whole frame behind and this one should be
+        dropped to catch up"""
+        if self.debt >= self.budget:
+            self.debt -= self.budget
+            self.skipped += 1
+            return True
+        return False
+
+    def start_frame(self):
+        """start timing a frame, returns the settings to process it with"""
+        self.stage_times = {}
+        self.frame_start = time.perf_counter()
+        return self.settings()
+
+    @contextmanager
+    def stage(self, name):
+        """time a stage of the current frame"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[name] = self.stage_times.get(name, 0.) + time.perf_counter() - start
+
+    def remaining(self):
+        """seconds left in the current frame's budget, negative once over"""
+        return self.budget - (time.perf_counter() - self.frame_start)
+
+    def end_frame(self):
+        """record the frame's time and adjust the knobs for the next one"""
+        frame_time = time.perf_counter() - self.frame_start
+        self.last_frame_time = frame_time
+        self.frames += 1
+        self.debt = max(self.debt + frame_time - self.budget, 0.)
+        self.adjust(frame_time, self.stage_times)
+
+    def adjust(self, frame_time, stage_times):
+        """scale the knobs so a frame like this one lands on headroom * budget"""
+        controlled = sum(seconds for name, seconds in stage_times.items() 
+            if any(name in knob.stages for knob in self.knobs))
+        if controlled <= 0:
+            return
+        fixed = frame_time - controlled
+        factor = (self.headroom * self.budget - fixed) / controlled
+        factor = min(max(factor, self.max_step[0]), self.max_step[1])
+        if abs(factor - 1) < self.deadband:
+            return
+
+        #a knob only moves if its stages ran
+        for knob in self.knobs:
+            if any(name in stage_times for name in knob.stages):
+                knob.scale(factor)
@@ -0,0 +1,106 @@
+import numpy as np
+
+class RangeImage(object):
+    """A frame projected onto a dense (ring, azimuth bin) grid. 
+
+    A spinning LIDAR already measures in this grid, so the neighbors of a 
+    point are just the cells around it. Neighbor lookups, density checks 
+    and floor removal become fixed size window operations over 2D arrays, 
+    and no kdtree has to be built. 
+
+    points are [x y z intensity ring_scan_number]. Rings are assumed to be 
+    numbered from the lowest laser up, like the velodyne driver does. When 
+    two points fall in one cell the closer one is kept."""
+    def __init__(self, points, n_azimuths=1800, n_rings=None):
+        self.points = np.asarray(points, dtype=float)
+        x, y, z = self.points[:, 0], self.points[:, 1], self.points[:, 2]
+        rings = self.points[:, 4].astype(np.int64)
+        if n_rings is None:
+            n_rings = rings.max() + 1 if len(rings) else 0
+        self.n_rings, self.n_azimuths = n_rings, n_azimuths
+
+        columns = np.floor((np.arctan2(y, x) + np.pi) / (2 * np.pi) * n_azimuths).astype(np.int64) % n_azimuths
+        cells = rings * n_azimuths + columns
+        self.cell_of_point = cells
+
+        #the first point of each cell after sorting by range is the closest 
+        order = np.lexsort((np.hypot(x, y), cells))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = cells[order][1:] != cells[order][:-1]
+        kept = order[first]
+
+        #index is -1 where a cell is empty
+        self.index = np.full(n_rings * n_azimuths, -1, dtype=np.int64)
+        self.index[cells[kept]] = kept
+        self.index = self.index.reshape(n_rings, n_azimuths)
+        self.xyz = np.full((n_rings, n_azimuths, 3), np.nan)
+        self.xyz[self.index >= 0] = self.points[self.index[self.index >= 0], :3]
+
+    def neighbors(self, point_index, ring_window=1, azimuth_window=1):
+        """indexes of the points in the window of cells around a point, 
+        including the point's own cell"""
+        cell = self.cell_of_point[point_index]
+        ring, column = cell // self.n_azimuths, cell % self.n_azimuths
+        rings = slice(max(ring - ring_window, 0), ring + ring_window + 1)
+        columns = np.arange(column - azimuth_window, column + azimuth_window + 1) % self.n_azimuths
+        window = self.index[rings][:, columns]
+        return window[window >= 0]
+
+    def density(self, radius, ring_window=1, azimuth_window=2):
+        """count the occupied cells in the window around every cell whose 
+        point is within radius of the cell's point, including itself. 
+        Returned per point, so points that lost their cell to a closer point 
+        get the count of the point that kept it."""
+        counts = np.zeros(self.index.shape, dtype=np.int64)
+        for dr in range(-ring_window, ring_window + 1):
+            for dc in range(-azimuth_window, azimuth_window + 1):
+                offsets = self._shifted(self.xyz, dr, dc) - self.xyz
+                #comparisons with empty cells are nan, so never counted
+                with np.errstate(invalid="ignore"):
+                    counts += np.einsum("ijk,ijk->ij", offsets, offsets) <= radius**2
+        return counts.ravel()[self.cell_of_point]
+
+    def min_density_mask(self, n_neighbors, radius, ring_window=1, azimuth_window=2):
+        """mask of the points with at least n_neighbors points within radius 
+        inside their window"""
+        return self.density(radius, ring_window, azimuth_window) >= n_neighbors
+
+    def floor_mask(self, max_slope=.15, max_floor_height=.1):
+        """mask of the points on the floor. 
+
+        Walking up each column from the lowest ring, a cell is floor if the 
+        cell below it is floor and the slope between them is under max_slope 
+        radians. The lowest ring is floor where it's below max_floor_height."""
+        floor = np.zeros(self.index.shape, dtype=bool)
+        if not self.n_rings:
+            return floor.ravel()[self.cell_of_point]
+
+        with np.errstate(invalid="ignore"):
+            lowest = self.xyz[0]
+            floor[0] = lowest[:, 2] < max_floor_height
+
+            #each ring only depends on the one below it, so walk up the rings 
+            #and handle every column at once
+            below_xyz = lowest
+            for ring in range(1, self.n_rings):
+                current = self.xyz[ring]
+                rise = current[:, 2] - below_xyz[:, 2]
+                run = np.hypot(current[:, 0], current[:, 1]) - np.hypot(below_xyz[:, 0], below_xyz[:, 1])
+                floor[ring] = floor[ring - 1] & (np.abs(np.arctan2(rise, np.abs(run))) < max_slope)
+
+                #empty cells don't break a column, the next ring is 
+                #compared to the last occupied one
+                occupied = ~np.isnan(current[:, 2])
+                floor[ring][~occupied] = floor[ring - 1][~occupied]
+                below_xyz = np.where(occupied[:, None], current, below_xyz)
+        return (floor & (self.index >= 0)).ravel()[self.cell_of_point]
+
+    def _shifted(self, grid, rings, columns):
+        """grid moved by rings and columns. Azimuth wraps around, 
+        rings shifted past the edge are empty."""
+        shifted = np.roll(grid, columns, axis=1)
+        if rings:
+            shifted = np.roll(shifted, rings, axis=0)
+            empty = slice(None, rings) if rings > 0 else slice(rings, None)
+            shifted[empty] = np.nan
+        return shifted
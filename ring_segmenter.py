@@ -0,0 +1,79 @@
+from wall_grower import ODR_Fit
+import numpy as np
+
+class RingSegmenter(object):
+    """Find walls by walking along each laser ring of an unfiltered scan. 
+
+    Velodyne points are [x y z intensity ring_scan_number], and the points 
+    of one ring come out of the sensor in azimuth order. Walking a ring, 
+    a wall is a run of points without a big jump between neighbors or a 
+    sharp turn. That makes this an O(n) alternative front end to WallGrower 
+    that never builds a kdtree. The ring column has to be kept, so run it 
+    before take_xy. """
+    def __init__(self, pointcloud):
+        self.pointcloud = pointcloud
+
+    def make_network(self, max_gap=.2, corner_threshold=2.5, min_length=4, window=3):
+        """replace the pointcloud with a collection of lines. 
+
+        for every ring, in azimuth order:
+            break the ring wherever consecutive points are max_gap or more apart 
+            break it again at corners, where the angle between the points window 
+            steps before and after a point is less than corner_threshold 
+            fit each piece with at least min_length points with ODR 
+
+        Returns linesegments and lines in the same format as WallGrower.make_network. """
+        points = np.asarray(self.pointcloud.points, dtype=float)
+        if not len(points):
+            return np.empty((0, 2), dtype=int), []
+        rings = points[:, 4].astype(np.int64)
+
+        #a stable sort by ring keeps each ring's points in firing order 
+        order = np.argsort(rings, kind="stable")
+        xy = points[order, :2]
+        rings = rings[order]
+
+        #breaks[i] means the step from point i to point i + 1 is not part of a wall 
+        steps = np.diff(xy, axis=0)
+        breaks = (rings[1:] != rings[:-1]) | (np.hypot(steps[:, 0], steps[:, 1]) >= max_gap)
+        breaks |= self._find_corners(xy, breaks, corner_threshold, window)
+
+        segments = np.split(order, np.nonzero(breaks)[0] + 1)
+        segments = [s for s in segments if len(s) >= min_length]
+        if not segments:
+            return np.empty((0, 2), dtype=int), []
+
+        linesegments = np.vstack([np.column_stack([s[:-1], s[1:]]) for s in segments])
+        lines = [ODR_Fit(s.tolist(), self.pointcloud) for s in segments]
+        return linesegments, lines
+
+    def _find_corners(self, xy, breaks, corner_threshold, window):
+        """mark the step after every corner point. A point is only checked when 
+        there is no break within window steps of it, so noise between neighboring 
+        points doesn't look like a corner and corners are never checked across 
+        two different walls."""
+        corners = np.zeros(len(breaks), dtype=bool)
+        n = len(xy)
+        if n <= 2 * window:
+            return corners
+
+        #the number of breaks before each point tells us if a window is unbroken
+        breaks_before = np.concatenate([[0], np.cumsum(breaks)])
+        centers = np.arange(window, n - window)
+        unbroken = breaks_before[centers + window] == breaks_before[centers - window]
+
+        before = xy[centers - window] - xy[centers]
+        after = xy[centers + window] - xy[centers]
+        lengths = np.hypot(before[:, 0], before[:, 1]) * np.hypot(after[:, 0], after[:, 1])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cosines = np.einsum("ij,ij->i", before, after) / lengths
+        #a straight wall has an angle of pi
+        angles = np.arccos(np.clip(cosines, -1, 1))
+        corner_centers = centers[unbroken & (lengths > 0) & (angles < corner_threshold)]
+
+        #several points near a corner can be under the threshold, so only the 
+        #sharpest point of each run of them starts a new wall 
+        if len(corner_centers):
+            runs = np.split(corner_centers, np.nonzero(np.diff(corner_centers) > 1)[0] + 1)
+            corners[[run[np.argmin(angles[run - window])] for run in runs]] = True
+        return corners
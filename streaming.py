@@ -0,0 +1,195 @@
+"""Find walls in frames as they arrive over a socket.
+
+    python streaming.py replay --mock 100 --rate 1 --port 5555
+    python streaming.py listen --port 5555
+
+Frames are sent like a PointCloud2 without the field descriptions: a
+header with the stamp, point count and field count, then the points as
+float32 rows of [x y z intensity ring]. The stamp is when the frame was
+published, so the listener's latency is the whole way from publishing
+to walls found.
+
+The listener reads frames on the event loop and runs the pipeline in an
+executor, so reading never waits on processing. When processing falls
+behind only the newest frame is kept, older waiting frames are dropped."""
+import asyncio
+import struct
+import time
+import numpy as np
+
+HEADER = struct.Struct("<dII")
+
+def encode_frame(stamp, points):
+    points = np.ascontiguousarray(points, dtype=np.float32)
+    return HEADER.pack(stamp, len(points), points.shape[1] if points.ndim == 2 else 0) + points.tobytes()
+
+async def read_frame(reader):
+    """the next (stamp, points) from a stream, or None once it closes"""
+    try:
+        stamp, n_points, n_fields = HEADER.unpack(await reader.readexactly(HEADER.size))
+        payload = await reader.readexactly(4 * n_points * n_fields)
+    except asyncio.IncompleteReadError:
+        return None
+    return stamp, np.frombuffer(payload, dtype=np.float32).reshape(n_points, n_fields)
+
+class ReplayServer(object):
+    """Publish recorded frames to every client that connects, spaced out
+    like they were recorded, sped up by rate.
+
+    frames is a list of (time in seconds, points), like DataLoader.frames
+    yields. Each frame is stamped with the time it's sent."""
+    def __init__(self, frames, rate=1., host="127.0.0.1", port=0):
+        self.frames = frames
+        self.rate = rate
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        """start listening, returns the port, which is picked by the system if port was 0"""
+        self.server = await asyncio.start_server(self._publish, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def _publish(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first = self.frames[0][0] if self.frames else 0.
+        try:
+            for frame_time, points in self.frames:
+                delay = start + (frame_time - first) / self.rate - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                writer.write(encode_frame(time.time(), points))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.server.close()
+
+
+class LatencyStats(object):
+    """end to end latency and processing time of every processed frame"""
+    def __init__(self):
+        self.latencies = []
+        self.processing_times = []
+        self.received = 0
+        self.dropped = 0
+
+    def add(self, latency, processing_time):
+        self.latencies.append(latency)
+        self.processing_times.append(processing_time)
+
+    def to_dict(self):
+        latencies = np.array(self.latencies)
+        summary = {"received": self.received, "processed": len(latencies), "dropped": self.dropped}
+        if len(latencies):
+            summary.update({"mean": latencies.mean(), "p50": np.percentile(latencies, 50),
+                "p90": np.percentile(latencies, 90), "p99": np.percentile(latencies, 99),
+                "max": latencies.max(), "mean_processing": float(np.mean(self.processing_times))})
+        return summary
+
+
+def find_walls(points, settings=None):
+    """process_frame for an executor, returning the walls as [x0 y0 x1 y1]
+    segments, which are cheap to send back from another process"""
+    from wall_grower import process_frame
+    from wall_map import to_segments
+    _, lines, _ = process_frame(np.asarray(points, dtype=float), **(settings or {}))
+    return to_segments(lines)
+
+class StreamProcessor(object):
+    def __init__(self, process=find_walls, executor=None, on_result=None):
+        """process(points) runs in executor, a ProcessPoolExecutor with one
+        worker by default. on_result(stamp, result) is called on the event
+        loop with each frame's result."""
+        self.process = process
+        self.executor = executor
+        self.on_result = on_result
+        self.stats = LatencyStats()
+        self._latest = None
+        self._ready = None
+        self._closed = False
+
+    async def run(self, host, port):
+        """process frames from host:port until the stream closes. returns the stats"""
+        executor = self.executor
+        if executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            executor = ProcessPoolExecutor(1)
+        self._ready = asyncio.Event()
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            await asyncio.gather(self._receive(reader), self._work(executor))
+        finally:
+            writer.close()
+            if self.executor is None:
+                executor.shutdown()
+        return self.stats
+
+    async def _receive(self, reader):
+        """keep only the newest frame waiting"""
+        while True:
+            frame = await read_frame(reader)
+            if frame is None:
+                break
+            self.stats.received += 1
+            if self._latest is not None:
+                self.stats.dropped += 1
+            self._latest = frame
+            self._ready.set()
+        self._closed = True
+        self._ready.set()
+
+    async def _work(self, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            #check before waiting, the last frame and the close can both
+            #come in while a frame is processed
+            if self._latest is None:
+                if self._closed:
+                    return
+                await self._ready.wait()
+                self._ready.clear()
+                continue
+            stamp, points = self._latest
+            self._latest = None
+            start = time.perf_counter()
+            result = await loop.run_in_executor(executor, self.process, points)
+            self.stats.add(time.time() - stamp, time.perf_counter() - start)
+            if self.on_result is not None:
+                self.on_result(stamp, result)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="stream frames to the wall finder")
+    parser.add_argument("mode", choices=["replay", "listen"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--bag", help="replay this bag")
+    parser.add_argument("--mock", type=int, default=0, help="replay this many mock rooms at 10 Hz instead")
+    parser.add_argument("--rate", type=float, default=1., help="replay speed, 2 is twice real time")
+    args = parser.parse_args()
+
+    async def replay():
+        if args.bag:
+            from data_handler import DataLoader
+            frames = list(DataLoader(args.bag).frames())
+        else:
+            from mock_data import make_room
+            frames = [(.1 * i, make_room(30000, seed=i).points) for i in range(args.mock)]
+        server = ReplayServer(frames, args.rate, args.host, args.port)
+        await server.start()
+        print("publishing %d frames on port %d" % (len(frames), server.port))
+        async with server.server:
+            await server.server.serve_forever()
+
+    async def listen():
+        on_result = lambda stamp, walls: print("%.3f: %d walls" % (stamp, len(walls)))
+        stats = await StreamProcessor(on_result=on_result).run(args.host, args.port)
+        print(stats.to_dict())
+
+    asyncio.run(replay() if args.mode == "replay" else listen())
@@ -0,0 +1,188 @@
+"""Tune the wall_grower pipeline's parameters against frames with known walls.
+
+    frames = [make_room(30000, seed=i) for i in range(9)]
+    results = Sweep(frames).run(grid(SPACE))
+
+This is the python side of the random search in jl_pipeline/pipeline.jl.
+A configuration sets biased_undersample's percentile and radius, the
+take_centroids count and make_network's max_distance, corner_threshold
+and min_length, and is scored by the F1 of mock_data.score_walls.
+
+Configurations sharing their preprocessing are run together, so each
+frame is undersampled and clustered once for all of them, and the groups
+are spread over a process pool. Successive halving stops the bad
+configurations early: every round only the best 1/eta are kept and
+given eta times the frames, scoring just the frames they haven't seen."""
+import itertools
+import random
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from mock_data import score_walls
+from pointcloud import Pointcloud
+from wall_grower import WallGrower
+
+class Uniform(object):
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def sample(self, rng):
+        return self.low + rng.rand() * (self.high - self.low)
+
+class IntRange(object):
+    """low to high, both included"""
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def sample(self, rng):
+        return int(rng.randint(self.low, self.high + 1))
+
+class Choice(object):
+    def __init__(self, options):
+        self.options = options
+
+    def sample(self, rng):
+        return self.options[rng.randint(len(self.options))]
+
+#the search space, in pipeline order. Choices make configurations share
+#preprocessing, which continuous ranges never do
+SPACE = {
+    "percentile": Choice([.05, .1, .2]),
+    "radius": Choice([.3, .6]),
+    "n_centroids": Choice([200, 300, 400]),
+    "max_distance": Choice([.1, .2, .3, .4]),
+    "corner_threshold": Choice([2.5, 2.7, 2.9]),
+    "min_length": Choice([3, 5]),
+}
+
+#the parameters of each stage, a stage's results are shared by
+#configurations agreeing on it and every stage before it
+STAGES = [("undersample", ["percentile", "radius"]), ("centroids", ["n_centroids"]),
+    ("network", ["max_distance", "corner_threshold", "min_length"])]
+
+def sample(space, n, seed=None):
+    """n random configurations"""
+    rng = np.random.RandomState(seed)
+    return [{key: value.sample(rng) for key, value in space.items()} for _ in range(n)]
+
+def grid(space):
+    """every combination of a space made of Choices"""
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*[space[key].options for key in keys])]
+
+def f1(precision, recall):
+    return 2 * precision * recall / (precision + recall) if precision + recall else 0.
+
+def _prefix(config, stage):
+    """the parameters of config up to and including the stage'th stage"""
+    return tuple(config[key] for _, keys in STAGES[:stage + 1] for key in keys)
+
+#the frames, set once in each worker process by _init_worker
+_frames = None
+
+def _init_worker(frames):
+    global _frames
+    _frames = frames
+
+def evaluate_group(configs, frame_indexes, frames=None, floor=.05):
+    """score configs sharing their undersample parameters on the frames
+    at frame_indexes. Each frame's preprocessing is reseeded, so every
+    configuration sees the same random subsample.
+
+    returns a (configs, frames) array of F1 scores"""
+    frames = _frames if frames is None else frames
+    scores = np.zeros((len(configs), len(frame_indexes)))
+    for j, frame_index in enumerate(frame_indexes):
+        frame = frames[frame_index]
+        random.seed(frame_index)
+        np.random.seed(frame_index)
+        pointcloud = Pointcloud(frame.points)
+        pointcloud.remove_floor(floor=floor)
+        pointcloud.take_xy()
+        pointcloud.take_percentage(.5)
+        pointcloud.biased_undersample(percentile=configs[0]["percentile"], radius=configs[0]["radius"])
+        undersampled = pointcloud.points
+
+        centroids = {}
+        for i, config in enumerate(configs):
+            if config["n_centroids"] not in centroids:
+                np.random.seed(frame_index)
+                pointcloud = Pointcloud(undersampled)
+                pointcloud.take_centroids(min(config["n_centroids"], len(undersampled)), exact=True)
+                centroids[config["n_centroids"]] = pointcloud
+            _, lines = WallGrower(centroids[config["n_centroids"]]).make_network(config["max_distance"],
+                config["corner_threshold"], config["min_length"])
+            scores[i, j] = f1(*score_walls(lines, frame.walls))
+    return scores
+
+class Sweep(object):
+    def __init__(self, frames, processes=None):
+        """frames have .points and the true .walls, like a MockedScene.
+        processes=1 runs everything in this process."""
+        self.frames = frames
+        self.processes = processes
+
+    def run(self, configs, min_frames=1, eta=3):
+        """successive halving over configs, starting with min_frames frames each.
+
+        returns (mean score, frames scored, config) for every configuration,
+        best first. Configurations stopped early have fewer frames scored."""
+        scores = [[] for _ in configs]
+        alive = list(range(len(configs)))
+        n_frames = min(min_frames, len(self.frames))
+        executor = None
+        if self.processes != 1:
+            executor = ProcessPoolExecutor(self.processes, initializer=_init_worker, initargs=(self.frames,))
+        try:
+            while True:
+                self._score(configs, alive, n_frames, scores, executor)
+                if len(alive) == 1 or n_frames == len(self.frames):
+                    break
+                alive.sort(key=lambda i: -np.mean(scores[i]))
+                alive = alive[:max(len(alive) // eta, 1)]
+                n_frames = min(n_frames * eta, len(self.frames))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        results = [(float(np.mean(s)), len(s), config) for s, config in zip(scores, configs)]
+        #finishing more rounds beats a lucky start
+        return sorted(results, key=lambda result: (-result[1], -result[0]))
+
+    def _score(self, configs, alive, n_frames, scores, executor):
+        """score the alive configs on the frames they haven't seen yet,
+        one task per group sharing an undersample prefix"""
+        groups = {}
+        for i in alive:
+            if len(scores[i]) < n_frames:
+                groups.setdefault((_prefix(configs[i], 0), len(scores[i])), []).append(i)
+        tasks = []
+        for (_, seen), members in groups.items():
+            #group members by centroid count so their clustering is shared in order
+            members.sort(key=lambda i: _prefix(configs[i], 1))
+            tasks.append((members, list(range(seen, n_frames))))
+        if executor is None:
+            outputs = [evaluate_group([configs[i] for i in members], frame_indexes, self.frames)
+                for members, frame_indexes in tasks]
+        else:
+            outputs = executor.map(evaluate_group, [[configs[i] for i in members] for members, _ in tasks],
+                [frame_indexes for _, frame_indexes in tasks])
+        for (members, _), group_scores in zip(tasks, outputs):
+            for i, row in zip(members, group_scores):
+                scores[i].extend(row.tolist())
+
+if __name__ == "__main__":
+    import argparse
+    from mock_data import make_room
+    parser = argparse.ArgumentParser(description="tune the pipeline on mock rooms")
+    parser.add_argument("--frames", type=int, default=9)
+    parser.add_argument("--points", type=int, default=30000)
+    parser.add_argument("--random", type=int, default=None, help="sample this many configurations instead of the grid")
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    frames = [make_room(args.points, seed=i) for i in range(args.frames)]
+    configs = grid(SPACE) if args.random is None else sample(SPACE, args.random)
+    for score, n_frames, config in Sweep(frames, args.processes).run(configs, eta=args.eta)[:10]:
+        print("%.3f over %d frames  %s" % (score, n_frames, config))
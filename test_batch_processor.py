@@ -0,0 +1,36 @@
+import numpy as np
+from mock_data import make_room
+from batch_processor import BatchProcessor, make_shards
+
+class MockLoader(object):
+    """a DataLoader over a mocked bag with a frame every .1 seconds for half a second"""
+    def __init__(self, filename, start_time=None, end_time=None):
+        self.filename = filename
+        self.start_time = -np.inf if start_time is None else start_time
+        self.end_time = np.inf if end_time is None else end_time
+
+    def time_range(self):
+        return 0., .4
+
+    def frames(self):
+        for i, time in enumerate(np.arange(5) * .1):
+            if self.start_time <= time < self.end_time:
+                yield time, make_room(8000, seed=i).points
+
+    def close(self):
+        pass
+
+def test_batch_processor(tmp_path):
+    for name in ["b.bag", "a.bag", "notes.txt"]:
+        (tmp_path / name).write_text("")
+    settings = {"n_centroids": 300, "max_distance": .15}
+    processor = BatchProcessor(str(tmp_path), shard_seconds=.15, processes=2, settings=settings, loader=MockLoader)
+    assert len(make_shards(processor.bags, .15, MockLoader)) == 6
+
+    results = list(processor.run())
+    #every frame once, in bag then time order
+    assert [(r["bag"][-5:], round(r["time"], 1)) for r in results] == [
+        (bag, time) for bag in ["a.bag", "b.bag"] for time in [0., .1, .2, .3, .4]]
+    assert all(r["n_points"] == 8000 for r in results)
+    assert any(len(r["walls"]) for r in results)
+    assert all(len(wall) == 4 for r in results for wall in r["walls"])
@@ -0,0 +1,46 @@
+import numpy as np
+from line import LCPopulation
+from genetic_optimizer import GASelector
+from mock_data import room_walls, sample_walls
+
+def brute_force_score(selector, lines):
+    """the score as the original per point loop computed it"""
+    explained = np.zeros(selector.matrix.shape[1], dtype=bool)
+    for line_index in lines:
+        explained |= selector.matrix[line_index] < selector.local_neighborhood_radius
+    return explained.sum()
+
+def test_ga_selector():
+    np.random.seed(7)
+    points = sample_walls(room_walls(4, 3, notch=0, doorway=0, rotation=0), noise=0)
+    population = LCPopulation(points.tolist(), local_neighborhood_radius=.3)
+    population.add_random(40)
+    gas = GASelector(population, population.pointcloud, popsize=30, lines_in_sol=4, 
+        local_neighborhood_radius=.05)
+    assert all(gas.scores[i] == brute_force_score(gas, gas.population[i]) for i in range(30))
+
+    first_score = gas.best_solution()["score"]
+    for _ in range(30):
+        gas.run_iter()
+    best = gas.best_solution()
+    assert best["score"] >= first_score
+    assert all(gas.scores[i] == brute_force_score(gas, gas.population[i]) for i in range(30))
+    assert best["score"] > .8 * len(points)
+
+def test_local_search_selector():
+    from local_search import LocalSearchSelector
+    np.random.seed(8)
+    points = sample_walls(room_walls(4, 3, notch=0, doorway=0, rotation=0), noise=0)
+    population = LCPopulation(points.tolist(), local_neighborhood_radius=.3)
+    population.add_random(40)
+    ls = LocalSearchSelector(population, population.pointcloud, lines_in_sol=4, 
+        local_neighborhood_radius=.05)
+    greedy_score = ls.best_solution()["score"]
+    assert ls.run(time_budget=1, max_iterations=200) == 200
+
+    #the running score tracks the solution through every accepted swap 
+    assert ls.score == brute_force_score(ls, ls.solution)
+    best = ls.best_solution()
+    assert best["score"] >= greedy_score
+    assert best["score"] == brute_force_score(ls, best["lines"])
+    assert best["score"] > .8 * len(points)
@@ -0,0 +1,40 @@
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+from matplotlib import pyplot as plt
+from matplotlib.collections import LineCollection
+import graphs
+from mock_data import make_room
+from pointcloud import Pointcloud
+from wall_grower import WallGrower
+
+def test_decimate():
+    xy = np.random.RandomState(0).rand(100000, 2)
+    keep = graphs.decimate(xy, resolution=100)
+    assert len(keep) <= 100 * 100 and np.all(np.diff(keep) > 0)
+    assert len(graphs.decimate(xy[:50], resolution=100)) == 50
+
+def test_graph_frame(tmp_path):
+    pointcloud = Pointcloud(make_room(20000, seed=4).points)
+    pointcloud.remove_floor(floor=.1)
+    pointcloud.take_xy()
+    pointcloud.take_centroids(400)
+    linesegments, lines = WallGrower(pointcloud).make_network(.12, 2.7, 3)
+
+    figure = plt.figure()
+    graphs.graph_pointcloud(pointcloud)
+    graphs.graph_line_segments(linesegments, pointcloud)
+    graphs.graph_polylines([[0, 1, 2], [3, 4]], pointcloud)
+    graphs.graph_slope_intercept_lines(lines, pointcloud)
+    #every group of segments is a single artist
+    collections = [c for c in figure.axes[0].collections if isinstance(c, LineCollection)]
+    assert [len(c.get_segments()) for c in collections] == [len(linesegments), 3, len(lines)]
+    plt.close(figure)
+
+    with graphs.FrameRenderer(figsize=(3, 3), dpi=50) as renderer:
+        futures = [renderer.render(str(tmp_path / ("frame_%d.png" % i)), pointcloud, linesegments, lines)
+            for i in range(3)]
+        #the frames were copied, so the pointcloud can change under the renderer
+        pointcloud.take_percentage(.1)
+    assert all((tmp_path / ("frame_%d.png" % i)).stat().st_size for i in range(3))
+    assert [f.result() for f in futures] == [str(tmp_path / ("frame_%d.png" % i)) for i in range(3)]
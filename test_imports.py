@@ -0,0 +1,13 @@
+import subprocess
+import sys
+
+CORE_MODULES = ["pointcloud", "line", "wall_grower", "data_handler", "genetic_optimizer",
+    "local_search", "hough", "ring_segmenter", "range_image", "floor_plane", "pointcloud_pipeline"]
+
+def test_core_imports_are_light():
+    """importing the pipeline modules must not load any heavy dependency, 
+    those are imported when the method needing them is first called"""
+    code = "import sys, %s; print(' '.join(sys.modules))" % ", ".join(CORE_MODULES)
+    loaded = set(subprocess.check_output([sys.executable, "-c", code]).decode().split())
+    for heavy in ["scipy", "sklearn", "matplotlib", "rosbag", "numba"]:
+        assert heavy not in loaded
@@ -0,0 +1,77 @@
+import numpy as np
+import kernels
+
+KERNEL_SETS = [("python", kernels.python_longest_path, kernels.python_coverage_scores, kernels.python_spread_angles)]
+COUNT_CLOSE = [("python", kernels.python_count_close)]
+if kernels.numba is not None:
+    KERNEL_SETS.append(("numba", kernels.numba_longest_path, kernels.numba_coverage_scores, kernels.numba_spread_angles))
+    COUNT_CLOSE.append(("numba", kernels.numba_count_close))
+
+def recursive_longest_path(current_point, neighbors, already_included):
+    """the original recursive _order_segments_from, trying options in order"""
+    options = [o for o in neighbors[current_point] if o not in already_included]
+    longest_found = []
+    for option in options:
+        already_included.add(option)
+        path = recursive_longest_path(option, neighbors, already_included)
+        already_included.remove(option)
+        if len(path) > len(longest_found):
+            longest_found = path
+    return [current_point] + longest_found
+
+def random_graph(rng, n):
+    """a branched chain, like a noisy wall's nearest neighbor network"""
+    neighbors = [set() for _ in range(n)]
+    for a in range(1, n):
+        for b in set(rng.randint(max(a - 3, 0), a, 2)):
+            neighbors[a].add(b)
+            neighbors[b].add(a)
+    neighbors = [sorted(ns) for ns in neighbors]
+    indptr = np.cumsum([0] + [len(ns) for ns in neighbors])
+    return neighbors, indptr, np.array([o for ns in neighbors for o in ns], dtype=np.int64)
+
+def test_longest_path():
+    rng = np.random.RandomState(0)
+    for _ in range(20):
+        neighbors, indptr, indices = random_graph(rng, 12)
+        start = rng.randint(12)
+        expected = recursive_longest_path(start, neighbors, set())
+        for name, longest_path, _, _ in KERNEL_SETS:
+            included = np.zeros(12, dtype=bool)
+            assert longest_path(start, indptr, indices, included).tolist() == expected, name
+            assert not included.any()
+
+def test_coverage_scores():
+    rng = np.random.RandomState(1)
+    explains = rng.rand(50, 300) < .1
+    coverage = np.packbits(explains, axis=1)
+    solutions = rng.randint(0, 50, (40, 6))
+    expected = [np.any(explains[s], axis=0).sum() for s in solutions]
+    for name, _, coverage_scores, _ in KERNEL_SETS:
+        assert coverage_scores(coverage, solutions, 7).tolist() == expected, name
+
+def test_spread_angles():
+    rng = np.random.RandomState(2)
+    thetas = rng.uniform(-np.pi, np.pi, 500)
+    skip = rng.rand(500) < .1
+    #the original loop over the angles
+    tried, expected = [], np.zeros(500, dtype=bool)
+    for i, theta in enumerate(thetas):
+        if skip[i] or (tried and min([np.abs(t - theta) for t in tried]) < .05):
+            continue
+        tried.append(theta)
+        expected[i] = True
+    for name, _, _, spread_angles in KERNEL_SETS:
+        assert np.array_equal(spread_angles(thetas, skip, .05), expected), name
+
+def test_count_close():
+    from pointcloud import _Grid
+    rng = np.random.RandomState(3)
+    xy = rng.uniform(0, 2, (500, 2))
+    grid = _Grid(xy, .1 / np.sqrt(2), reach=2)
+    indexes = rng.choice(500, 100, replace=False)
+    starts, counts = grid.nearby_cells(indexes)
+    expected = (np.hypot(*(xy[indexes, None] - xy[None]).T) <= .1).T.sum(axis=1)
+    for name, count_close in COUNT_CLOSE:
+        assert np.array_equal(count_close(xy, indexes, starts, counts, grid.order, .1, 1000), expected), name
+        assert np.array_equal(count_close(xy, indexes, starts, counts, grid.order, .1, 3), np.minimum(expected, 3)), name
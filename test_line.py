@@ -0,0 +1,170 @@
+import numpy as np
+from line import Line, line_point_distance, line_point_distances, batch_fit_odr, batch_fit_theil_sen
+from mock_data import sample_walls, wall_at
+
+def angle_error(a, b):
+    """difference between two line angles, ignoring direction"""
+    return np.abs((a - b + np.pi/2) % np.pi - np.pi/2)
+
+def test_fit_odr():
+    np.random.seed(0)
+    for i, theta in enumerate([0, .7, np.pi/2, 2.5]):
+        line = Line({"x": 0, "y": 0, "theta": 0}, sample_walls(wall_at(theta), seed=i))
+        line.fit_odr()
+        assert angle_error(line.params["theta"], theta) < .01
+        assert line_point_distance(line, [1, 2]) < .01
+
+def test_fit_theil_sen():
+    np.random.seed(1)
+    #vertical walls wrap around the angle discontinuity
+    for i, theta in enumerate([.7, np.pi/2, -np.pi/2 + .01]):
+        points = sample_walls(wall_at(theta), spacing=.02, n_outliers=100, seed=i)
+        line = Line({"x": 0, "y": 0, "theta": 0}, points.tolist())
+        line.fit_theil_sen(n_pairs=2000)
+        assert angle_error(line.params["theta"], theta) < .05
+        assert line_point_distance(line, [1, 2]) < .05
+
+    #few enough points to use every pair
+    line = Line({"x": 0, "y": 0, "theta": 0}, [[0, 0], [1, 1], [2, 2], [3, 3]])
+    line.fit_theil_sen()
+    assert angle_error(line.params["theta"], np.pi/4) < 1e-9
+
+def test_scores_share_distance_cache():
+    from pointcloud import Pointcloud
+    pointcloud = Pointcloud([[0, 1], [1, -2], [2, 3]])
+    line = Line({"x": 0, "y": 0, "theta": 0}, pointcloud)
+    assert line.score_OLS_ODR() == 1 + 4 + 9
+    distances = line._distances
+    assert line.score_LAD_ODR() == 1 + 2 + 3
+    assert line.score_total_norm_cdf() < 0
+    assert line._distances is distances
+
+    #editing params in place invalidates the cache
+    line.params["y"] = 1
+    assert line.score_LAD_ODR() == 0 + 3 + 2
+
+    #so does changing the pointcloud
+    distances = line._distances
+    pointcloud.take_xy()
+    assert line._calc_point_distances() is not distances
+    pointcloud.points = [[0, 5]]
+    assert line.score_LAD_ODR() == 4
+
+    #points edited in place have to be flagged, for a Pointcloud or a plain list
+    pointcloud.points[0][1] = 7
+    pointcloud._points_changed()
+    assert line.score_LAD_ODR() == 6
+    points = [[0, 1], [1, -2]]
+    line = Line({"x": 0, "y": 0, "theta": 0}, points)
+    assert line.score_LAD_ODR() == 3
+    points[1][1] = -4
+    line.points_changed()
+    assert line.score_LAD_ODR() == 5
+
+    #vectorized distances agree with the scalar version
+    points = np.random.uniform(-3, 3, (20, 2))
+    line.params.update({"x": .3, "y": -1, "theta": 2.})
+    expected = [line_point_distance(line, p) for p in points]
+    assert np.allclose(line_point_distances(line, points), expected)
+
+def test_hough_lines():
+    from hough import hough_lines
+    np.random.seed(2)
+    walls = [sample_walls(wall_at(theta), spacing=.03, seed=i) for i, theta in enumerate([.3, 1.9])]
+    points = np.vstack(walls + [np.random.uniform(-5, 5, (50, 2))])
+    lines = hough_lines(points, min_votes=30, max_lines=5)
+    assert len(lines) == 2
+    thetas = sorted(l.params["theta"] % np.pi for l in lines)
+    assert np.allclose(thetas, [.3, 1.9], atol=.03)
+    for line in lines:
+        #anchored on the wall, near the middle of its points
+        assert line_point_distance(line, [1, 2]) < .05
+        assert np.hypot(line.params["x"] - 1, line.params["y"] - 2) < 1
+
+def test_hough_lines_wraparound():
+    from hough import hough_lines
+    #the normals of these walls point at 0 and just under pi, so the second 
+    #wall's peak is next to where the first one's wraps around
+    walls = [wall_at(np.pi/2, center=(3, 0)), wall_at(np.radians(89), center=(-3, 0))]
+    lines = hough_lines(sample_walls(walls, spacing=.03, seed=4), min_votes=30, max_lines=5)
+    assert len(lines) == 2
+    thetas = sorted(l.params["theta"] % np.pi for l in lines)
+    assert np.allclose(thetas, [np.radians(89), np.pi/2], atol=.01)
+    assert sorted(np.round([l.params["x"] for l in lines])) == [-3, 3]
+
+def test_lcpopulation_shares_pointcloud():
+    from line import LCPopulation
+    np.random.seed(3)
+    points = sample_walls(wall_at(.7), spacing=.03, seed=3)
+    population = LCPopulation(points.tolist(), local_neighborhood_radius=.5)
+    #the list is converted once, and the pointcloud holds that array
+    assert population.pointcloud.points is population.points
+    population.add_random(10)
+    assert len(population.linecasters) == 10
+    for lc in population.linecasters:
+        #casters hold index arrays into the one shared pointcloud
+        assert lc.indexes.dtype.kind == "i"
+        assert lc.pointcloud is population.pointcloud
+        neighborhood = population.pointcloud.take(lc.indexes)
+        assert np.all(np.hypot(*(neighborhood - lc.centerpoint).T) <= .5)
+        assert angle_error(lc.line.params["theta"], .7) < .1
+
+def test_point_array_never_copies_the_pointcloud():
+    from pointcloud import Pointcloud
+    np.random.seed(4)
+    points = sample_walls(wall_at(.7), spacing=.03, seed=4).tolist()
+    pointcloud = Pointcloud(points)
+    indexes = np.array([3, 1, 4])
+    lines = [Line({"x": 0, "y": 0, "theta": 0}, pointcloud, indexes) for _ in range(3)]
+
+    #the list is turned into an array once, for every line
+    array = pointcloud.as_array()
+    assert pointcloud.as_array() is array
+    for line in lines:
+        assert np.array_equal(line._point_array(), array[indexes])
+    assert pointcloud.as_array() is array
+
+    #changing the points makes a new array
+    pointcloud.take_percentage(.5)
+    assert pointcloud.as_array() is not array and len(pointcloud.as_array()) == len(pointcloud.points)
+
+    #a plain list is picked from by index
+    line = Line({"x": 0, "y": 0, "theta": 0}, points, [3, 1, 4])
+    assert np.array_equal(line._point_array(), np.array(points)[[3, 1, 4]])
+
+def test_batch_fits():
+    np.random.seed(5)
+    thetas = [0, .7, np.pi/2, 2.5]
+    points = np.vstack([sample_walls(wall_at(theta), n_outliers=20, seed=i) for i, theta in enumerate(thetas)])
+    neighborhoods = [np.arange(220 * k, 220 * (k + 1)) for k in range(4)] + [np.array([3]), np.array([], dtype=int)]
+
+    #the batched odr is exactly the one line fit, for every neighborhood
+    fits = batch_fit_odr(points, neighborhoods)
+    for neighborhood, fit in zip(neighborhoods[:4], fits):
+        line = Line({"x": 0, "y": 0, "theta": 0}, points, neighborhood)
+        line.fit_odr()
+        assert np.allclose(fit, [line.params["x"], line.params["y"], line.params["theta"]])
+    assert np.isnan(fits[4:]).all()
+
+    fits = batch_fit_theil_sen(points, neighborhoods, n_pairs=2000)
+    for theta, (x, y, fit_theta) in zip(thetas, fits):
+        line = Line({"x": x, "y": y, "theta": fit_theta}, [])
+        assert angle_error(fit_theta, theta) < .05
+        assert line_point_distance(line, [1, 2]) < .05
+    assert np.isnan(fits[4:]).all()
+
+    #duplicate points can't give an angle
+    assert np.isnan(batch_fit_theil_sen(np.ones((5, 2)), [np.arange(5)])).all()
+
+def test_lcpopulation_fits():
+    from line import LCPopulation
+    np.random.seed(6)
+    points = sample_walls(wall_at(.7), spacing=.03, n_outliers=30, seed=6)
+    population = LCPopulation(points, local_neighborhood_radius=1.)
+    population.add_random(10)
+    for fit in [population.fit_odr, population.fit_theil_sen]:
+        for lc in population.linecasters:
+            lc.line.params["theta"] = 0
+        fit()
+        errors = [angle_error(lc.line.params["theta"], .7) for lc in population.linecasters]
+        assert np.median(errors) < .1
@@ -0,0 +1,52 @@
+import numpy as np
+from mock_data import make_room, room_walls, sample_walls, score_walls, wall_at
+from pointcloud import Pointcloud
+from wall_grower import WallGrower
+
+def test_make_room():
+    scene = make_room(4000, seed=1)
+    assert scene.points.shape == (4000, 5)
+    assert scene.is_floor.any() and scene.is_outlier.any()
+    assert not (scene.is_floor & scene.is_outlier).any()
+
+    #every wall point is on one of the walls
+    xy = scene.points[~scene.is_floor & ~scene.is_outlier, :2]
+    starts, spans = scene.walls[:, :2], scene.walls[:, 2:] - scene.walls[:, :2]
+    t = np.clip(np.einsum("pwk,wk->pw", xy[:, None] - starts, spans) / (spans**2).sum(axis=1), 0, 1)
+    closest = starts + t[..., None] * spans
+    distances = np.linalg.norm(xy[:, None] - closest, axis=2).min(axis=1)
+    assert np.percentile(distances, 99) < .1
+
+def test_sample_walls():
+    #a plain rectangle is four walls, walked around back to the first corner
+    walls = room_walls(4, 3, notch=0, doorway=0, rotation=0)
+    assert len(walls) == 4 and np.array_equal(walls[0, :2], walls[-1, 2:])
+    points = sample_walls(walls, spacing=.1, noise=0)
+    assert len(points) == 140 and len(np.unique(points, axis=0)) == 140
+
+    #outliers come last, and height adds a z column
+    points = sample_walls(wall_at(.7), spacing=.05, n_outliers=20, height=2, seed=0)
+    assert points.shape == (220, 3) and np.all((points[:, 2] >= 0) & (points[:, 2] <= 2))
+    normal = np.array([-np.sin(.7), np.cos(.7)])
+    offsets = np.abs((points[:200, :2] - [1, 2]) @ normal)
+    assert offsets.max() < .05
+
+    #dust stays on its ray, only closer
+    clean = make_room(4000, outlier_fraction=0, noise=0, seed=2)
+    dusty = make_room(4000, outlier_fraction=.05, noise=0, ray_outliers=True, seed=2)
+    moved = dusty.is_outlier & ~clean.is_outlier
+    assert moved.any()
+    assert np.allclose(np.arctan2(*dusty.points[moved, :2].T), np.arctan2(*clean.points[moved, :2].T))
+    assert np.all(np.hypot(*dusty.points[moved, :2].T) < np.hypot(*clean.points[moved, :2].T))
+
+def test_score_walls():
+    scene = make_room(30000, seed=2)
+    pointcloud = Pointcloud(scene.points)
+    pointcloud.remove_floor(floor=.1)
+    pointcloud.take_xy()
+    _, lines = WallGrower(pointcloud).make_ransac_network(.05, min_length=20)
+    assert score_walls(lines, scene.walls) == (1., 1.)
+    assert score_walls([], scene.walls) == (0., 0.)
+
+    #shifted walls don't match
+    assert score_walls(lines, room_walls(center=(1, 1)))[1] < .5
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+from scipy.spatial import distance_matrix
+from pointcloud import Pointcloud
+from mock_data import make_room, room_walls, sample_walls
+
+#an axis aligned room, scanned without noise 
+ROOM = {"walls": room_walls(10, 6, notch=0, doorway=0, rotation=0), "noise": 0, "outlier_fraction": 0}
+
+def test_min_density_filter():
+    points = sample_walls([(0, 0, 4, 0), (4, 0, 4, 4)], spacing=.004, noise=.02, n_outliers=200, height=2, seed=0)
+    n_close = (distance_matrix(points[:, :2], points[:, :2]) <= .1).sum(axis=1)
+    for workers in [1, 2]:
+        pointcloud = Pointcloud(points.tolist())
+        version = pointcloud.version
+        pointcloud.min_density_filter(4, .1, workers=workers, chunk_size=50)
+        assert np.array_equal(pointcloud.points, points[n_close >= 4])
+        assert pointcloud.version > version
+
+    #a far away point spreads the grid too thin for a table of its cells
+    far = np.vstack([points, [[1000, 1000, 0]]])
+    pointcloud = Pointcloud(far)
+    pointcloud.min_density_filter(4, .1)
+    assert np.array_equal(pointcloud.points, points[n_close >= 4])
+
+def test_range_image():
+    scene = make_room(16 * 900, **dict(ROOM, outlier_fraction=.002), ray_outliers=True, seed=3)
+    points = scene.points
+    image = Pointcloud(points).to_range_image(n_azimuths=900)
+    assert np.all(image.index >= 0)
+
+    #every point of a ring at an azimuth is next to the points of the neighboring rings
+    neighbors = image.neighbors(16 * 10 + 5)
+    assert sorted(points[neighbors, 4]) == [4, 4, 4, 5, 5, 5, 6, 6, 6]
+
+    #outliers were pulled toward the sensor, away from their neighbors
+    mask = image.min_density_mask(3, .2)
+    assert mask.sum() > np.sum(~scene.is_outlier) - 10
+    assert not mask[scene.is_outlier].any()
+
+    #wall points just above the floor can't be told apart from it 
+    scene = make_room(16 * 900, **ROOM)
+    points, floor = scene.points, scene.is_floor
+    floor_mask = Pointcloud(points).to_range_image(n_azimuths=900).floor_mask()
+    assert np.all(floor_mask[floor])
+    assert np.all(points[floor_mask & ~floor, 2] < .1)
+
+def test_remove_floor_plane():
+    from floor_plane import FloorPlane
+    np.random.seed(4)
+    floor_plane = FloorPlane()
+    for tilt in [0, .05, .1]:
+        scene = make_room(16 * 360, **ROOM)
+        points, floor = scene.points, scene.is_floor
+        #tilt the sensor by rotating the scan around the x axis
+        c, s = np.cos(tilt), np.sin(tilt)
+        points[:, 1:3] = points[:, 1:3] @ np.array([[c, s], [-s, c]])
+        points[:, :3] += np.random.normal(0, .005, (len(points), 3))
+
+        pointcloud = Pointcloud(points)
+        pointcloud.remove_floor_plane(floor_plane, floor=.04)
+        assert np.isclose(np.arccos(floor_plane.normal[2]), tilt, atol=.01)
+        kept = np.isin(points[:, 0], pointcloud.points[:, 0])
+        assert not np.any(kept & floor)
+        assert kept[~floor].mean() > .95
+
+def test_outlier_filters():
+    walls = [(0, 0, 4, 0), (4, 0, 4, 4)]
+    points = sample_walls(walls, spacing=8 / 3000, noise=.02, n_outliers=100, height=2, seed=5)
+    is_outlier = np.arange(len(points)) >= 3000
+
+    pointcloud = Pointcloud(points)
+    model = pointcloud.isolation_forest_filter(contamination=.04)
+    kept = np.isin(points[:, 0], pointcloud.points[:, 0])
+    assert kept[is_outlier].mean() < .3 and kept[~is_outlier].mean() > .95
+
+    #the fitted model works on the next frame, wherever it is
+    shifted = sample_walls(walls, spacing=8 / 3000, noise=.02, n_outliers=100, height=2, seed=6) + [20, -7, 0]
+    pointcloud = Pointcloud(shifted)
+    pointcloud.isolation_forest_filter(model=model)
+    kept = np.isin(shifted[:, 0], pointcloud.points[:, 0])
+    assert kept[is_outlier].mean() < .3 and kept[~is_outlier].mean() > .95
+
+    pointcloud = Pointcloud(points)
+    pointcloud.statistical_outlier_filter(k=8, std_ratio=1.)
+    kept = np.isin(points[:, 0], pointcloud.points[:, 0])
+    assert kept[is_outlier].mean() < .3 and kept[~is_outlier].mean() > .95
+
+def test_pointcloud_pipeline():
+    from pointcloud_pipeline import PointcloudPipeline
+    np.random.seed(6)
+    points = make_room(16 * 360, **dict(ROOM, outlier_fraction=.01), ray_outliers=True, seed=6).points
+    points[:, 3] = np.arange(len(points)) #tag points through the intensity column
+
+    #the fused pipeline matches running the filters one at a time 
+    expected = Pointcloud(points)
+    expected.remove_floor(.05)
+    expected.take_xy()
+    expected.min_density_filter(3, .3)
+    expected.statistical_outlier_filter(k=4)
+
+    pipeline = PointcloudPipeline().remove_floor(.05).take_xy()
+    pipeline.min_density_filter(3, .3).statistical_outlier_filter(k=4)
+    assert pipeline._needed_columns(5) == [0, 1, 2]
+    pointcloud = pipeline.run(points)
+    assert np.array_equal(pointcloud.points, np.asarray(expected.points))
+
+    #masks are combined, and can still read columns take_xy will drop
+    pipeline = PointcloudPipeline().take_percentage(.5).remove_floor(.05).take_xy()
+    pipeline.remove_floor(.05).take_centroids(20)
+    pointcloud = pipeline.run(points)
+    assert np.asarray(pointcloud.points).shape == (20, 2)
+
+    tagged = PointcloudPipeline().remove_floor(.05).take_percentage(.5).run(points)
+    assert np.all(tagged.points[:, 2] > .05)
+    assert .4 < len(tagged.points) / np.sum(points[:, 2] > .05) < .6
+    assert np.all(np.diff(tagged.points[:, 3]) > 0)
+
+def test_pointcloud_pipeline_dropped_columns():
+    from pointcloud_pipeline import PointcloudPipeline
+    points = make_room(16 * 90, **ROOM).points
+
+    #z can be read after take_xy, up until the centroids replace the points
+    pointcloud = PointcloudPipeline().take_xy().remove_floor(.05).take_centroids(20).run(points)
+    assert np.asarray(pointcloud.points).shape == (20, 2)
+
+    #the centroids only have x and y, so z is gone after them
+    pipeline = PointcloudPipeline().take_xy().take_centroids(20).remove_floor(.05)
+    with pytest.raises(ValueError):
+        pipeline.run(points)
+    with pytest.raises(ValueError):
+        PointcloudPipeline().remove_floor(.05).run(points[:, :2])
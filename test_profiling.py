@@ -0,0 +1,44 @@
+import json
+import numpy as np
+from mock_data import make_room
+from pointcloud import Pointcloud
+from wall_grower import WallGrower
+from profiling import Profiler, Histogram
+
+def test_profiler():
+    original = Pointcloud.remove_floor
+    profiler = Profiler()
+    with profiler:
+        for seed in range(2):
+            with profiler.stage("frame"):
+                pointcloud = Pointcloud(make_room(20000, seed=seed).points)
+                pointcloud.remove_floor(floor=.1)
+                pointcloud.take_xy()
+                pointcloud.biased_undersample(percentile=.1, radius=.6)
+                pointcloud.take_centroids(400)
+                WallGrower(pointcloud).make_network(.12, 2.7, 3)
+    assert Pointcloud.remove_floor is original
+
+    stages = profiler.to_dict()["stages"]
+    assert stages["frame"]["calls"] == 2
+    assert stages["Pointcloud.remove_floor"]["points_in"] == 40000
+    assert stages["Pointcloud.take_centroids"]["points_out"] == 800
+    assert stages["WallGrower._extract_subgroups"]["calls"] == 2
+    assert stages["WallGrower._fit_bounded_odr"]["calls"] >= stages["WallGrower.make_network"]["points_out"] > 0
+    assert stages["frame"]["points_in"] is None
+
+    #one kdtree for biased_undersample and one for make_network, every frame
+    assert profiler.kdtree_rebuilds == 4
+    json.dumps(profiler.to_dict())
+
+    #nothing is recorded once disabled
+    Pointcloud(np.zeros((5, 3))).remove_floor()
+    assert profiler.to_dict()["stages"]["Pointcloud.remove_floor"]["calls"] == 2
+
+def test_histogram():
+    histogram = Histogram()
+    for seconds in [.001] * 90 + [.1] * 10:
+        histogram.add(seconds)
+    assert .001 <= histogram.percentile(.5) < .002
+    assert .1 <= histogram.percentile(.99) < .2
+    assert histogram.to_dict()["n"] == 100
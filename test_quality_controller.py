@@ -0,0 +1,49 @@
+from quality_controller import QualityController
+from mock_data import make_room, score_walls
+from wall_grower import process_frame
+
+def test_adjust():
+    controller = QualityController(budget=.1)
+
+    #twice over budget, with .02 seconds nothing can shrink
+    controller.adjust(.2, {"remove_floor": .02, "take_centroids": .1, "ga_selector": .08})
+    settings = controller.settings()
+    assert settings["n_centroids"] == 200 and settings["n_generations"] == 10
+    #biased_undersample didn't run, so percentage is left alone
+    assert settings["percentage"] == .5
+
+    #under budget creeps back up, but never past the starting values
+    for _ in range(10):
+        controller.adjust(.01, {"take_centroids": .005, "ga_selector": .005})
+    assert controller.settings()["n_centroids"] == 400
+    assert controller.settings()["n_generations"] == 20
+
+def test_skip_frames():
+    controller = QualityController(budget=.1)
+    controller.debt = .25
+    assert [controller.should_skip() for _ in range(4)] == [True, True, False, False]
+    assert controller.skipped == 2
+
+    #process_frame drops a frame the same way, without touching the controller's timing
+    controller.debt = .1
+    assert process_frame(make_room(2000, seed=0).points, controller) is None
+    assert controller.skipped == 3 and controller.frames == 0
+
+def test_process_frame():
+    points = make_room(20000, seed=3).points
+    controller = QualityController(budget=.001)
+    linesegments, lines, selected = process_frame(points, controller, n_linecasters=20)
+    assert len(lines)
+    #the GASelector is skipped once the frame is over budget
+    assert selected == [] and "ga_selector" not in controller.stage_times
+    assert controller.settings()["n_centroids"] < 400 and controller.debt > 0
+
+    _, _, selected = process_frame(points, n_generations=5, n_linecasters=20)
+    assert len(selected) == 10
+
+def test_process_frame_defaults():
+    for seed in range(2):
+        scene = make_room(30000, seed=seed)
+        _, lines, selected = process_frame(scene.points)
+        precision, recall = score_walls(lines, scene.walls)
+        assert recall == 1 and precision > .6 and selected == []
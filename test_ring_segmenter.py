@@ -0,0 +1,21 @@
+import numpy as np
+from pointcloud import Pointcloud
+from ring_segmenter import RingSegmenter
+from mock_data import make_room, room_walls
+
+def test_ring_segmenter():
+    #two level rings, so neither one hits the floor
+    walls = room_walls(10, 6, notch=0, doorway=0, rotation=.3)
+    scene = make_room(2 * 720, n_rings=2, walls=walls, noise=0, outlier_fraction=0, max_elevation=0)
+    pointcloud = Pointcloud(scene.points)
+    linesegments, lines = RingSegmenter(pointcloud).make_network(max_gap=.2, min_length=10)
+
+    #each ring has the four walls, with the wall behind the sensor cut in 
+    #two where the ring starts and ends 
+    assert len(lines) == 2 * 5
+    slopes = np.array([l.params["m"] for l in lines])
+    assert np.all(np.isclose(slopes, np.tan(.3), atol=.02) | np.isclose(slopes, -1/np.tan(.3), atol=.02))
+
+    #segments never connect two rings
+    rings = np.asarray(pointcloud.points)[:, 4]
+    assert np.all(rings[linesegments[:, 0]] == rings[linesegments[:, 1]])
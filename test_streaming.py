@@ -0,0 +1,44 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from mock_data import make_room
+from streaming import ReplayServer, StreamProcessor, encode_frame, read_frame
+
+def slow_count(points):
+    time.sleep(.05)
+    return len(points)
+
+def test_latest_frame_wins():
+    #a frame every 10 ms, processing takes 50
+    frames = [(.01 * i, np.full((100 + i, 5), i, dtype=float)) for i in range(30)]
+    results = []
+
+    async def run():
+        server = ReplayServer(frames, rate=1.)
+        port = await server.start()
+        processor = StreamProcessor(slow_count, ThreadPoolExecutor(1),
+            on_result=lambda stamp, result: results.append(result))
+        stats = await processor.run("127.0.0.1", port)
+        server.close()
+        return stats.to_dict()
+
+    stats = asyncio.run(run())
+    assert stats["received"] == 30
+    assert stats["processed"] + stats["dropped"] == 30 and stats["dropped"] > 10
+    #frames are processed in order, always ending with the last one
+    assert results == sorted(results) and results[-1] == 129
+    assert .05 <= stats["p50"] < 1.
+
+def test_frame_encoding():
+    points = make_room(1000, seed=5).points
+
+    async def roundtrip():
+        reader = asyncio.StreamReader()
+        reader.feed_data(encode_frame(12.5, points))
+        reader.feed_eof()
+        return await read_frame(reader), await read_frame(reader)
+
+    (stamp, decoded), end = asyncio.run(roundtrip())
+    assert stamp == 12.5 and end is None
+    assert np.allclose(decoded, points, atol=1e-4)
@@ -0,0 +1,24 @@
+from mock_data import make_room
+from sweep import Sweep, Choice, grid, sample, evaluate_group, SPACE
+
+def test_successive_halving():
+    frames = [make_room(12000, seed=i) for i in range(4)]
+    space = dict(SPACE, percentile=Choice([.1]), radius=Choice([.6]), n_centroids=Choice([150, 300]),
+        max_distance=Choice([.05, .4]), corner_threshold=Choice([2.7]), min_length=Choice([3, 5]))
+    configs = grid(space)
+    assert len(configs) == 8
+
+    results = Sweep(frames, processes=2).run(configs, min_frames=1, eta=2)
+    #8 configs on 1 frame, 4 on 2, 2 on 4 
+    assert sorted(n for _, n, _ in results) == [1, 1, 1, 1, 2, 2, 4, 4]
+    best_score, _, best = results[0]
+    assert best["max_distance"] == .4 and best_score > .6
+
+    #the best configuration scores the same when run on its own
+    scores = evaluate_group([best], range(4), frames)
+    assert abs(scores.mean() - best_score) < 1e-9
+
+def test_sample():
+    configs = sample(SPACE, 5, seed=1)
+    assert len(configs) == 5 and all(set(c) == set(SPACE) for c in configs)
+    assert configs == sample(SPACE, 5, seed=1)
@@ -0,0 +1,86 @@
+import time
+import warnings
+import numpy as np
+from line import line_point_distance
+from mock_data import make_room, room_walls, sample_walls, score_walls
+from pointcloud import Pointcloud
+from wall_grower import WallGrower
+
+def test_make_ransac_network():
+    np.random.seed(0)
+    walls = [(0, 1, 6, 4), (6, 4, 8, 0), (10, 6, 14, 8)]
+    points = np.vstack([sample_walls(walls, seed=0), np.random.uniform(0, 14, (40, 2))])
+    wg = WallGrower(Pointcloud(points))
+    linesegments, lines = wg.make_ransac_network(max_distance=.05, min_length=10, max_walls=5)
+
+    #the first and third wall are collinear, so the gap between them splits one wall into two
+    assert len(lines) == 3
+    slopes = sorted(np.tan(l.params["theta"]) for l in lines)
+    assert np.allclose(slopes, [-2, .5, .5], atol=.05)
+    for line in lines:
+        assert line_point_distance(line, (7, 4.5 if np.tan(line.params["theta"]) > 0 else 2)) < .1
+
+def test_make_ransac_network_vertical_wall():
+    #a wall along x = 3 has no slope, so it has to fit without dividing by zero
+    np.random.seed(0)
+    points = sample_walls([(3, 0, 3, 5), (0, 6, 5, 6)], seed=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        _, lines = WallGrower(Pointcloud(points)).make_ransac_network(.05, min_length=10, max_walls=2)
+    assert len(lines) == 2
+    vertical = min(lines, key=lambda l: abs(np.cos(l.params["theta"])))
+    (x0, y0), (x1, y1) = vertical.start_point, vertical.end_point
+    assert np.allclose([x0, x1], 3, atol=.02)
+    assert np.allclose(sorted([y0, y1]), [0, 5], atol=.05)
+
+def test_make_ransac_network_duplicate_points():
+    #every pair drawn is one point twice, so there's no line to find
+    linesegments, lines = WallGrower(Pointcloud(np.ones((10, 2)))).make_ransac_network(.05)
+    assert lines == [] and linesegments.shape == (0, 2)
+
+def test_make_network():
+    points = sample_walls([(0, 1, 6, 4), (6.1, 4, 8, 0), (10, 6, 14, 8)], spacing=.2, noise=.02, seed=0)
+    wg = WallGrower(Pointcloud(points))
+    linesegments, lines = wg.make_network(max_distance=.3, corner_threshold=2.5, min_length=3)
+
+    #segments are index pairs that are never longer than max_distance
+    lengths = np.hypot(*(points[linesegments[:, 0]] - points[linesegments[:, 1]]).T)
+    assert linesegments.shape[1] == 2 and np.all(lengths < .3)
+    assert sorted(len(l.points) for l in lines) == [19, 19, 31]
+
+def test_make_network_residual_passes():
+    dense = sample_walls([(0, 1, 6, 4)], spacing=.1, seed=1)
+    sparse = sample_walls([(10, 6, 14, 8)], spacing=.5, seed=2)
+    wg = WallGrower(Pointcloud(np.vstack([dense, sparse])))
+
+    _, lines = wg.make_network(max_distance=.2, min_length=3)
+    assert len(lines) == 1
+
+    linesegments, lines = wg.make_network(max_distance=.2, min_length=3, residual_distances=[.8])
+    assert len(lines) == 2
+    assert sorted(len(l.points) for l in lines)[0] > 3
+    #the residual pass only connects points that weren't already claimed
+    assert np.all(linesegments[:, 0] != linesegments[:, 1])
+
+def test_make_network_main_loop_distance():
+    #at the main loop's max_distance the centroids join into big looped 
+    #groups, which have to be cut down to trees to be ordered
+    scene = make_room(30000, seed=0)
+    np.random.seed(0)
+    pointcloud = Pointcloud(scene.points)
+    pointcloud.remove_floor(floor=.05)
+    pointcloud.take_xy()
+    pointcloud.take_percentage(.5)
+    pointcloud.biased_undersample(percentile=.1, radius=.6)
+    pointcloud.take_centroids(400)
+    start = time.perf_counter()
+    _, lines = WallGrower(pointcloud).make_network(max_distance=.4, corner_threshold=2.7, min_length=3)
+    assert time.perf_counter() - start < 5
+    precision, recall = score_walls(lines, scene.walls)
+    assert recall == 1 and precision > .7
+
+def test_make_network_closed_loop():
+    square = sample_walls(room_walls(4, 4, notch=0, doorway=0, rotation=0), spacing=.1, noise=0)
+    _, lines = WallGrower(Pointcloud(square)).make_network(max_distance=.3, min_length=3)
+    assert len(lines) == 4
+    assert all(len(l.points) >= 35 for l in lines)
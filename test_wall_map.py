@@ -0,0 +1,59 @@
+import numpy as np
+from mock_data import room_walls, score_walls
+from wall_map import WallMap, _segment_point_distances
+
+def observe(walls, pose, rng, noise=.02):
+    """walls as the robot at pose would see them, in pieces with noisy ends"""
+    x, y, theta = pose
+    c, s = np.cos(theta), np.sin(theta)
+    pieces = []
+    for wall in walls:
+        cut = rng.uniform(.3, .7)
+        middle = wall[:2] + cut * (wall[2:] - wall[:2])
+        pieces += [np.concatenate([wall[:2], middle]), np.concatenate([middle, wall[2:]])]
+    #into the robot's frame
+    local = (np.array(pieces).reshape(-1, 2, 2) - [x, y]) @ np.array([[c, -s], [s, c]])
+    return local.reshape(-1, 4) + rng.normal(0, noise, (len(pieces), 4))
+
+class Segments(object):
+    """stands in for the bounded lines of make_network"""
+    def __init__(self, segment):
+        self.start_point, self.end_point = segment[:2], segment[2:]
+
+def test_fuse_frames():
+    rng = np.random.RandomState(0)
+    walls = room_walls()
+    wall_map = WallMap()
+    for pose in [(0, 0, 0), (1, .5, .4), (-2, 1, -1.)]:
+        wall_map.add_frame([Segments(s) for s in observe(walls, pose, rng)], pose)
+    assert len(wall_map) == len(walls)
+
+    segments = wall_map.segments
+    #score_walls takes bounded lines with a start_point and end_point
+    class Bounded(object):
+        def __init__(self, s):
+            self.start_point, self.end_point = s[:2], s[2:]
+    assert score_walls([Bounded(s) for s in segments], walls) == (1., 1.)
+
+def test_walls_near():
+    rng = np.random.RandomState(1)
+    wall_map = WallMap(cell_size=.5)
+    starts = rng.uniform(-20, 20, (300, 2))
+    segments = np.hstack([starts, starts + rng.normal(0, 2, (300, 2))])
+    wall_map.add_frame(segments)
+    for point in rng.uniform(-20, 20, (20, 2)):
+        ids = wall_map.walls_near(point, 3)
+        distances = _segment_point_distances(wall_map.segments, point)
+        assert sorted(map(tuple, wall_map.wall(ids).tolist())) == sorted(map(tuple, wall_map.segments[distances <= 3].tolist()))
+
+def test_eviction():
+    wall_map = WallMap(max_age=2, max_walls=3)
+    for i in range(5):
+        wall_map.add_frame([[10 * i, 0, 10 * i + 1, 0]])
+    #only the walls seen in the last 2 frames are kept
+    assert len(wall_map) == 3
+    assert np.allclose(np.sort(wall_map.segments[:, 0]), [20, 30, 40])
+
+    wall_map.add_frame([[50, 0, 51, 0], [60, 0, 61, 0], [70, 0, 71, 0]])
+    assert np.allclose(np.sort(wall_map.segments[:, 0]), [50, 60, 70])
+    assert wall_map.walls_near((20, 0), 1).size == 0
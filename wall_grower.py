@@ -1,10 +1,7 @@
+from contextlib import nullcontext
 from pointcloud import Pointcloud
-from data_handler import DataLoader
-import graphs
 import itertools 
 import numpy as np
-from scipy import odr
-from copy import deepcopy
 
 def odr_linear_definition(B, x):
     #FIXME: is a line represented this way capable of 
@@ -16,6 +13,7 @@ def odr_linear_definition(B, x):
 class ODR_Fit(object):
     """fit scipy odr, and provide methods for bounding the resulting line"""
     def __init__(self, list_of_points, pointcloud):
+        from scipy import odr
         self.points = list_of_points 
         model = odr.Model(odr_linear_definition)
 
@@ -38,7 +36,7 @@ class ODR_Fit(object):
         bounds = []
         for index in [-1, 0]:
             m, b = params 
-            p_x, p_y = pointcloud.points[self.points[index]]
+            p_x, p_y = pointcloud.points[self.points[index]][:2]
             bounds.append(self._find_closest_input_val(m, b, p_x, p_y))
         bounds.sort()
 
@@ -57,11 +55,28 @@ class ODR_Fit(object):
 
 
 
+class TLS_Fit(object):
+    """a total least squares line through point, perpendicular to normal, 
+    bounded like ODR_Fit by where the first and last of list_of_points 
+    land on it. It's stored as a point and an angle, so vertical lines 
+    are as good as any other"""
+    def __init__(self, list_of_points, pointcloud, point, normal):
+        self.points = list_of_points
+        direction = np.array([normal[1], -normal[0]])
+        ends = np.array([pointcloud.points[p][:2] for p in [list_of_points[0], list_of_points[-1]]], dtype=float)
+        low, high = np.sort((ends - point) @ direction)
+
+        self.params = {"x": point[0], "y": point[1], "theta": np.arctan2(direction[1], direction[0]), 
+            "low": low, "high": high}
+        self.start_point = list(point + low * direction)
+        self.end_point = list(point + high * direction)
+
 class WallGrower(object):
     def __init__(self, pointcloud):
         self.pointcloud = pointcloud
 
-    def make_network(self, max_distance, corner_threshold=2.5, min_length=4):
+    def make_network(self, max_distance, corner_threshold=2.5, min_length=4, workers=1, 
+            residual_distances=(), residual_k=8):
         """replace the pointcloud with a collection of lines. 
         The lines are generated like so: 
 
@@ -71,34 +86,65 @@ class WallGrower(object):
                 draw a line between the two points 
                 if the distance to the second neighbor is within the max_distance 
                 and is less than first_distance * max_second_ratio
-                    draw a line between the point and the second neighbor """
-        
-        #we will store each points two closest neighbors, if they exist
-        linesegments = {}
+                    draw a line between the point and the second neighbor 
+
+        then, for each of the (increasing) residual_distances: 
+            repeat the above on only the points that aren't part of a line yet, 
+            using the residual distance instead of max_distance 
 
+        The residual passes recover sparse far walls. A single pass with the 
+        largest distance would instead bridge the gaps between nearby walls 
+        in the dense parts of the frame.
+
+        linesegments is returned as an (n, 2) array of pairs of point indexes. """
+        
         #extract line segments
-        #FIXME: the kdtree query method used in the get_nearest_neighbors call 
-        #has a max distance term that speeds up computation. I'm ignoring it 
-        #FIXME: after extracting lines made up of close points, it may be good 
-        # to run another line extraction phase using larger distance tolerances
-        # on the remaining points
-        all_distances, all_indexes = self.pointcloud.get_nearest_neighbors(3)
-        for i in range(len(all_distances)):
-            linesegments[i] = set()
-            distances = all_distances[i]
-            indexes = all_indexes[i]
-            #each location we are querying is a point 
-            #in the pointcloud, so the closest neighbor 
-            #is always itself. So we start at 1:
-            if distances[1] < max_distance:
-                linesegments[i].add(indexes[1])
-                if distances[2] < max_distance:
-                    linesegments[i].add(indexes[2])
+        all_distances, all_indexes = self.pointcloud.get_nearest_neighbors(3, 
+            distance_upper_bound=max_distance, workers=workers)
+
+        #each location we are querying is a point 
+        #in the pointcloud, so the closest neighbor 
+        #is always itself. So we start at 1. Neighbors 
+        #past max_distance have an infinite distance
+        close = np.isfinite(all_distances[:, 1:])
+        sources = np.broadcast_to(np.arange(len(all_indexes))[:, None], close.shape)
+        linesegments = [np.column_stack([sources[close], all_indexes[:, 1:][close]])]
+        lines = self._grow_lines(linesegments[0], corner_threshold, min_length)
+
+        #the residual is tracked with a mask over the original pointcloud, 
+        #so its kdtree can be reused
+        claimed = np.zeros(len(all_indexes), dtype=bool)
+        for distance in residual_distances:
+            for line in lines:
+                claimed[line.points] = True
+            residual_segments = self._residual_segments(claimed, distance, residual_k, workers)
+            linesegments.append(residual_segments)
+            lines += self._grow_lines(residual_segments, corner_threshold, min_length)
 
+        #return the detected walls
+        return np.vstack(linesegments), lines
+
+    def _residual_segments(self, claimed, max_distance, k, workers=1):
+        """connect each unclaimed point to its two nearest unclaimed neighbors 
+        within max_distance. The kdtree still holds every point, so k neighbors 
+        are fetched and the claimed ones are skipped. """
+        sources = np.nonzero(~claimed)[0]
+        distances, indexes = self.pointcloud.get_nearest_neighbors(k, 
+            distance_upper_bound=max_distance, workers=workers, indexes=sources)
+
+        #missing neighbors point one past the end of claimed 
+        usable = np.isfinite(distances) & (indexes != sources[:, None])
+        usable[usable] = ~claimed[indexes[usable]]
+        usable &= np.cumsum(usable, axis=1) <= 2
+        sources = np.broadcast_to(sources[:, None], usable.shape)
+        return np.column_stack([sources[usable], indexes[usable]])
+
+    def _grow_lines(self, linesegments, corner_threshold, min_length):
+        """turn a network of linesegments into bounded lines"""
         #lines is a collection of vectors between neighboring points
         #these vectors make connected subgroups we want to be able to 
         #look at individually
-        subgroups = self._extract_subgroups(deepcopy(linesegments))
+        subgroups = self._extract_subgroups(linesegments)
 
         #subgroups are typically mostly linear, because of the nature 
         #of the data and the preprocessing we did, but they aren't perfect. 
@@ -118,11 +164,105 @@ class WallGrower(object):
         lines = [self._fit_bounded_odr(pl) for pl in polylines]
 
         #remove small lines 
-        lines = [l for l in lines if len(l.points) >= min_length]
-
-        #return the detected walls
+        return [l for l in lines if len(l.points) >= min_length]
+
+    def make_ransac_network(self, max_distance, min_length=4, max_walls=20, max_gap=None, 
+            confidence=.99, max_iterations=1000, batch_size=64):
+        """replace the pointcloud with a collection of lines using sequential RANSAC. 
+        This is an alternative to make_network with a more predictable runtime. 
+
+        until max_walls are found or too few points remain:
+            score batch_size lines drawn through random pairs of points at once, 
+            counting the points within max_distance of each line 
+            stop drawing batches once enough were tried to find the best line 
+            with probability confidence, or after max_iterations 
+            refit the best line to its inliers and remove them from the search 
+            split the inliers wherever consecutive points are more than max_gap apart 
+
+        Returns linesegments like make_network, and the walls as TLS_Fit lines. """
+        if max_gap is None:
+            max_gap = 4 * max_distance
+        xy = np.asarray(self.pointcloud.points, dtype=float)[:, :2]
+        remaining = np.arange(len(xy))
+
+        linesegments = []
+        lines = []
+        for _ in range(max_walls):
+            if len(remaining) < max(min_length, 2):
+                break
+            best_line = self._ransac_best_line(xy[remaining], max_distance, 
+                confidence, max_iterations, batch_size)
+            if best_line is None:
+                break
+            point, normal = best_line
+            inliers = np.abs((xy[remaining] - point) @ normal) < max_distance
+            if inliers.sum() < min_length:
+                break
+
+            #least squares refit so the wall isn't skewed toward the sampled pair
+            point, normal = self._total_least_squares(xy[remaining[inliers]])
+            inliers = np.abs((xy[remaining] - point) @ normal) < max_distance
+            wall = remaining[inliers]
+            remaining = remaining[~inliers]
+
+            #order the inliers along the wall, then break them up where there are gaps
+            direction = np.array([normal[1], -normal[0]])
+            along = xy[wall] @ direction
+            order = np.argsort(along)
+            breaks = np.nonzero(np.diff(along[order]) > max_gap)[0] + 1
+            for polyline in np.split(wall[order], breaks):
+                linesegments.append(np.column_stack([polyline[:-1], polyline[1:]]))
+                if len(polyline) >= min_length:
+                    lines.append(TLS_Fit(polyline.tolist(), self.pointcloud, point, normal))
+
+        linesegments = np.vstack(linesegments) if linesegments else np.empty((0, 2), dtype=int)
         return linesegments, lines
 
+    def _ransac_best_line(self, xy, max_distance, confidence, max_iterations, batch_size):
+        """find the line through two points of xy with the most inliers. 
+        Returns a point on the line and the line's unit normal, or None 
+        if every pair drawn was one point twice."""
+        best_count = -1
+        best_line = None
+        n_iterations = max_iterations
+        tried = 0
+        while tried < n_iterations:
+            #each column of distances is one hypothesis 
+            n = min(batch_size, n_iterations - tried)
+            a = xy[np.random.randint(0, len(xy), n)]
+            b = xy[np.random.randint(0, len(xy), n)]
+            normals = np.column_stack([a[:, 1] - b[:, 1], b[:, 0] - a[:, 0]])
+            lengths = np.hypot(normals[:, 0], normals[:, 1])
+            valid = lengths > 0
+            normals[valid] /= lengths[valid, None]
+            distances = np.abs(xy @ normals.T - np.sum(a * normals, axis=1))
+            counts = np.where(valid, np.sum(distances < max_distance, axis=0), -1)
+            tried += n
+
+            best = np.argmax(counts)
+            if counts[best] > best_count:
+                best_count = counts[best]
+                best_line = (a[best], normals[best])
+
+                #the standard adaptive stopping criterion: with an inlier ratio 
+                #of w, a pair is all inliers with probability w**2
+                w = best_count / len(xy)
+                if w >= 1:
+                    break
+                if w > 0:
+                    needed = np.log(1 - confidence) / np.log(1 - w**2)
+                    n_iterations = min(max_iterations, int(np.ceil(needed)))
+        if best_count < 0:
+            return None
+        return best_line
+
+    def _total_least_squares(self, xy):
+        """fit a line minimizing orthogonal distance. Returns 
+        the centroid and the line's unit normal."""
+        from line import principal_axis
+        centroid, theta = principal_axis(xy)
+        return centroid, np.array([-np.sin(theta), np.cos(theta)])
+
     def _check_similarity(self, a_line, b_line, euc_tolerance=.1, polar_tolerance=.1):
         """determine if two lines can be combined"""
         #first check if slopes lie within boundary 
@@ -151,113 +291,91 @@ class WallGrower(object):
         the passed connected group of linesegments."""
         #we want to take an ordered subset of the 
         #linesegments to make the longest possible 
-        #line. 
+        #line. the group is renumbered into compressed 
+        #rows once, and every search below shares them
+        nodes, indptr, indices = self._compressed_rows(linesegments)
+
         #the end of the line are points with only one 
         #connection
-        endpoints = self._find_endpoints(linesegments)
+        endpoints = self._find_endpoints(indptr)
 
         #now we try growing a line from each endpoint
         longest_found = []
         longest_length = 0
         for endpoint in endpoints:
-            order = self._order_segments_from(endpoint, linesegments)
+            order = self._order_segments_from(endpoint, indptr, indices)
             #FIXME: if the last point of this order is an endpoint we 
             # haven't tested yet, we can remove it
             if len(order) > longest_length:
                 longest_length = len(order)
                 longest_found = order 
 
-        return longest_found
-
-    def _find_endpoints(self, linesegments):
-        """Find all points in the connected group 
-        of linesegments that have only one attached line."""
-        #linesegments must be symmetric for this to work
-        for key in linesegments:
-            for otherkey in linesegments[key]:
-                linesegments[otherkey].add(key)
-
-        endpoints = []
-        for index in linesegments:
-            if len(linesegments[index]) == 1:
-                endpoints.append(index)
-        return endpoints
-
-    def _order_segments_from(self, current_point, linesegments, already_included=None):
-        """start at self.lines[key]. If there are neighboring points that 
-        aren't in the already_included set, call _follow_connections on each of 
-        them and return the longest sequence generated. If there are no neighboring
-        points, return the current point. """ 
-        if already_included is None:
-            already_included = set()
-
-        #remove points already in this line from the possible next points
-        options_from_here = set(linesegments[current_point]) - already_included
- 
-        if not len(options_from_here):
-            return [current_point]
-
-        #FIXME: we don't need to recurse if there's only one option
-        longest_found = []
-        longest_length = 0
-        for option in options_from_here:
-            already_included.add(option)
-            this_option_path = self._order_segments_from(option, linesegments, already_included)
-            already_included.remove(option)
-            if len(this_option_path) > longest_length:
-                longest_length = len(this_option_path)
-                longest_found = this_option_path
-        return [current_point] + longest_found
+        return nodes[longest_found].tolist()
+
+    def _compressed_rows(self, linesegments):
+        """renumber the connected group of linesegments 0..n-1 and return 
+        (nodes, indptr, indices): nodes[i] is the point numbered i, and 
+        the neighbors of i are indices[indptr[i]:indptr[i+1]], ascending."""
+        nodes, local = np.unique(linesegments, return_inverse=True)
+        local = local.reshape(-1, 2)
+        #each line is entered from both of its ends
+        rows = np.concatenate([local[:, 0], local[:, 1]])
+        columns = np.concatenate([local[:, 1], local[:, 0]])
+        indices = columns[np.lexsort((columns, rows))]
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(nodes)))])
+        return nodes, indptr, indices
+
+    def _find_endpoints(self, indptr):
+        """Find all points in the compressed rows that have 
+        only one attached line."""
+        return np.flatnonzero(np.diff(indptr) == 1).tolist()
+
+    def _order_segments_from(self, current_point, indptr, indices, already_included=None):
+        """start at row current_point of the compressed rows. Try continuing 
+        through each neighboring point that isn't in the already_included set, 
+        in order, and return the longest sequence generated. If there are no 
+        neighboring points, return the current point. 
+
+        The search itself is kernels.longest_path."""
+        from kernels import longest_path
+        included = np.zeros(len(indptr) - 1, dtype=bool)
+        included[list(already_included or ())] = True
+        return longest_path(current_point, indptr, indices, included)
         
-    def _extract_subgroups(self, lines):
-        """split up the passed linesegments into connected 
-        groups of linesegments"""
-         #each point can have more than one 
-         #line pointing at it. First, we need 
-         #to make lines symmetric 
-        for key in lines:
-            for otherkey in lines[key]:
-                lines[otherkey].add(key)
-        self.lines = lines 
-        polylines = []
-        while self.lines:
-            polylines.append(self._extract_subgroup(next(iter(self.lines))))
-        return polylines
-
-    def _extract_subgroup(self, key):
-        """pull out all linesegments that have a path to key"""
-        polyline = self._follow_connections(key)
-        #delete all nodes in network from self.lines
-        for point_index in list(polyline.keys()):
-            del self.lines[point_index]
-        return polyline
-
-    def _follow_connections(self, key, linesegments=None, already_included=None):
-        """recursively gather all the neighbors of the point 
-        indexed by key and add the line segments to group, unless the 
-        next point is in already_included"""
-
-        #is this the first start case or a recursive call 
-        if linesegments is None:
-            linesegments = {}
-            already_included = set()
-
-        #grab the connections for this point 
-        connections = self.lines[key]
-
-        #create an entry for this point in the polylines object 
-        linesegments[key] = set()
-
-        #loop over this points neighbors
-        for connection in connections:
-            #check the other point hasn't already been included 
-            if not connection in already_included:
-                #add the line to this point to the polyline 
-                linesegments[key].add(connection)
-                already_included.add(connection)
-                #follow this points connections
-                self._follow_connections(connection, linesegments, already_included)
-        return linesegments
+    def _extract_subgroups(self, linesegments):
+        """split up the passed linesegments into connected
+        groups of linesegments. Each group is an array of the 
+        linesegments between its points, one row per line.
+
+        Like _follow_connections used to, each group is handed on as a
+        depth first spanning tree of its linesegments. The nearest neighbor
+        network is full of triangles and loops, which leave a group without
+        endpoints and make ordering it exponential."""
+        from scipy import sparse
+        from scipy.sparse import csgraph
+        n_points = len(self.pointcloud.points)
+        if not len(linesegments):
+            return []
+        _, labels = csgraph.connected_components(sparse.coo_matrix(
+            (np.ones(len(linesegments), dtype=bool), (linesegments[:, 0], linesegments[:, 1])),
+            shape=(n_points, n_points)), directed=False)
+
+        #one search covers every group: an extra root node is joined to
+        #the first point of each group with lines, and cut off afterwards
+        points = np.unique(linesegments)
+        firsts = points[np.unique(labels[points], return_index=True)[1]]
+        root = n_points
+        edges = np.vstack([linesegments, np.column_stack([np.full(len(firsts), root), firsts])])
+        graph = sparse.coo_matrix((np.ones(len(edges), dtype=bool), (edges[:, 0], edges[:, 1])),
+            shape=(n_points + 1, n_points + 1)).tocsr()
+        _, predecessors = csgraph.depth_first_order(graph, root, directed=False)
+        children = points[predecessors[points] != root]
+        tree = np.column_stack([predecessors[children], children])
+
+        #sorting the tree by group and splitting it where the 
+        #group changes hands each group its own linesegments
+        tree = tree[np.argsort(labels[children], kind="stable")]
+        return np.split(tree, np.flatnonzero(np.diff(labels[tree[:, 1]])) + 1)
 
     def _split_up_polylines(self, polylines, corner_threshold=2.5):
         """each polyline is an ordered array of indexes to 
@@ -306,28 +424,100 @@ class WallGrower(object):
         return np.sqrt((x0-x1)**2 + (y0-y1)**2)
 
 
-data_loader = DataLoader("data_2020-06-10-10-24-18.bag")
-
-while True:
-    pointcloud = Pointcloud(data_loader.load_next_frame())
+def process_frame(points, controller=None, percentage=.5, n_centroids=400, n_generations=0,
+        n_linecasters=100, max_distance=.4):
+    """run the main loop's pipeline on one frame, without the graphs.
+
+    If n_generations isn't 0, a GASelector also picks lines_in_sol line
+    casters explaining the centroids.
+
+    A QualityController passed as controller times every stage and its
+    settings replace percentage, n_centroids and n_generations. When the
+    frame is already over budget the GASelector is skipped, and when 
+    processing has fallen a whole frame behind the frame is dropped.
+
+    returns the linesegments and lines of make_network, and the Lines
+    the GASelector picked (an empty list if it didn't run), or None if 
+    the frame was dropped"""
+    if controller is not None and controller.should_skip():
+        return None
+    settings = {"percentage": percentage, "n_centroids": n_centroids, "n_generations": n_generations}
+    if controller is not None:
+        settings.update(controller.start_frame())
+    stage = controller.stage if controller is not None else lambda name: nullcontext()
+
+    pointcloud = Pointcloud(points)
+    with stage("remove_floor"):
+        pointcloud.remove_floor(floor=.05)
+    with stage("take_xy"):
+        pointcloud.take_xy()
+    with stage("biased_undersample"):
+        pointcloud.take_percentage(settings["percentage"])
+        pointcloud.biased_undersample(percentile=.1, radius=.6)
+    with stage("take_centroids"):
+        pointcloud.take_centroids(min(settings["n_centroids"], len(pointcloud.points)), exact=True)
+    with stage("make_network"):
+        linesegments, lines = WallGrower(pointcloud).make_network(max_distance=max_distance,
+            corner_threshold=2.7, min_length=3)
+
+    selected = []
+    if settings["n_generations"] and (controller is None or controller.remaining() > 0):
+        from line import LCPopulation
+        from genetic_optimizer import GASelector
+        with stage("linecasters"):
+            population = LCPopulation(pointcloud.points)
+            population.add_random(n_linecasters)
+            gas = GASelector(population, population.pointcloud)
+        with stage("ga_selector"):
+            for _ in range(settings["n_generations"]):
+                gas.run_iter()
+        selected = [population.linecasters[i].line for i in gas.best_solution()["lines"]]
+
+    if controller is not None:
+        controller.end_frame()
+    return linesegments, lines, selected
+
+
+if __name__ == "__main__":
+    from data_handler import DataLoader
+    from quality_controller import QualityController
+    import graphs
+
+    data_loader = DataLoader("data_2020-06-10-10-24-18.bag")
+    controller = QualityController()
+
+    while True:
+        points = data_loader.load_next_frame()
+        if controller.should_skip():
+            continue
+        settings = controller.start_frame()
+        pointcloud = Pointcloud(points)
     
-    pointcloud.remove_floor(floor=.05)
-    graphs.graph_pointcloud(pointcloud, .5, c="yellow", title="points above floor")
+        with controller.stage("remove_floor"):
+            pointcloud.remove_floor(floor=.05)
+        graphs.graph_pointcloud(pointcloud, .5, c="yellow", title="points above floor")
 
-    pointcloud.take_xy()
+        with controller.stage("take_xy"):
+            pointcloud.take_xy()
 
-    pointcloud.take_percentage(.5)
-    graphs.graph_pointcloud(pointcloud, s=10, c="yellow", title="randomly undersampled")
+        with controller.stage("biased_undersample"):
+            pointcloud.take_percentage(settings["percentage"])
+        graphs.graph_pointcloud(pointcloud, s=10, c="yellow", title="randomly undersampled")
 
-    pointcloud.biased_undersample(percentile=.1, radius=.6)
-    graphs.graph_pointcloud(pointcloud, s=20, c="orange", title="biased undersampled")
+        with controller.stage("biased_undersample"):
+            pointcloud.biased_undersample(percentile=.1, radius=.6)
+        graphs.graph_pointcloud(pointcloud, s=20, c="orange", title="biased undersampled")
 
-    pointcloud.take_centroids(400, exact=True)
-    graphs.graph_pointcloud(pointcloud, s=40, c="red", title="kmeans centroid replaced")
+        with controller.stage("take_centroids"):
+            pointcloud.take_centroids(min(settings["n_centroids"], len(pointcloud.points)), exact=True)
+        graphs.graph_pointcloud(pointcloud, s=40, c="red", title="kmeans centroid replaced")
     
-    wg = WallGrower(pointcloud)
-    linesegments, lines = wg.make_network(max_distance=.4, corner_threshold=2.7, min_length=3)
-    graphs.graph_line_segments(linesegments, pointcloud, colors=["gray"])
-    graphs.graph_slope_intercept_lines(lines, pointcloud, colors=["black"], l=3)
-    graphs.show_graphs(title="Located Walls of 10/22 First LIDAR Scan")
-
+        with controller.stage("make_network"):
+            wg = WallGrower(pointcloud)
+            linesegments, lines = wg.make_network(max_distance=.4, corner_threshold=2.7, min_length=3)
+        graphs.graph_line_segments(linesegments, pointcloud, colors=["gray"])
+        graphs.graph_slope_intercept_lines(lines, pointcloud, colors=["black"], l=3)
+
+        #the frame ends before the graphs are shown, which waits on the window
+        controller.end_frame()
+        graphs.show_graphs(title="Located Walls of 10/22 First LIDAR Scan")
@@ -0,0 +1,195 @@
+import numpy as np
+
+def _segment_point_distances(segments, point):
+    """distance from point to each of the (n, 4) [x0 y0 x1 y1] segments"""
+    starts, spans = segments[:, :2], segments[:, 2:] - segments[:, :2]
+    lengths = np.maximum((spans**2).sum(axis=1), 1e-12)
+    t = np.clip(((point - starts) * spans).sum(axis=1) / lengths, 0, 1)
+    return np.linalg.norm(starts + t[:, None] * spans - point, axis=1)
+
+def to_segments(lines):
+    """[x0 y0 x1 y1] rows from the bounded lines make_network returns,
+    or from anything that's already segments"""
+    if len(lines) and hasattr(lines[0], "start_point"):
+        return np.array([list(l.start_point) + list(l.end_point) for l in lines], dtype=float)
+    return np.asarray(lines, dtype=float).reshape(-1, 4)
+
+
+class WallMap(object):
+    """Walls fused across frames into one global set of segments.
+
+    Every frame's walls are moved into the map frame with the robot's pose,
+    then merged into any mapped wall they line up with. Walls are found
+    through a uniform grid: each wall is registered in every cell it
+    crosses, so looking up the walls near a point only visits the cells
+    around it, however many walls the map holds.
+
+    Walls not seen for max_age frames are evicted, and when there are
+    more than max_walls the least recently seen go first, so memory stays
+    bounded as the robot explores."""
+    def __init__(self, cell_size=1., merge_distance=.15, merge_angle=.1, merge_gap=.3,
+            max_weight=20, max_age=None, max_walls=None):
+        """merge_distance is how far the ends of a new wall can be from a
+        mapped wall's line, merge_angle how far apart their angles can be,
+        and merge_gap how big a gap along the wall the merge can bridge.
+
+        A wall's weight is how many observations it's averaged over. It's
+        capped at max_weight so the map keeps following changes."""
+        self.cell_size = cell_size
+        self.merge_distance = merge_distance
+        self.merge_angle = merge_angle
+        self.merge_gap = merge_gap
+        self.max_weight = max_weight
+        self.max_age = max_age
+        self.max_walls = max_walls
+
+        self.frame = 0
+        #rows are reused once their wall is evicted, see _allocate
+        self._segments = np.empty((0, 4))
+        self._weights = np.empty(0)
+        self._last_seen = np.empty(0, dtype=np.int64)
+        self._alive = np.empty(0, dtype=bool)
+        self._free = []
+        self._cells = {}
+
+    def __len__(self):
+        return int(self._alive.sum())
+
+    @property
+    def segments(self):
+        """(n, 4) [x0 y0 x1 y1] of every wall in the map"""
+        return self._segments[self._alive]
+
+    def add_frame(self, lines, pose=(0., 0., 0.)):
+        """fuse one frame's walls into the map. lines are the lines
+        make_network returns or [x0 y0 x1 y1] segments, in the robot's
+        frame. pose is the robot's (x, y, heading) in the map.
+
+        returns the ids of the walls each line was merged into. Merging 
+        and eviction reuse ids, so they're only good until the next frame"""
+        self.frame += 1
+        x, y, theta = pose
+        c, s = np.cos(theta), np.sin(theta)
+        segments = to_segments(lines).reshape(-1, 2, 2) @ np.array([[c, s], [-s, c]]) + [x, y]
+        ids = [self._observe(segment.ravel()) for segment in segments]
+        self.evict()
+        return ids
+
+    def walls_near(self, point, radius):
+        """ids of the walls within radius of point, closest first"""
+        candidates = self._candidates(np.asarray(point, dtype=float)[:2], radius)
+        if not len(candidates):
+            return candidates
+        distances = _segment_point_distances(self._segments[candidates], np.asarray(point, dtype=float)[:2])
+        order = np.argsort(distances, kind="stable")
+        return candidates[order][distances[order] <= radius]
+
+    def wall(self, wall_id):
+        return self._segments[wall_id]
+
+    def evict(self):
+        """drop walls older than max_age, then the least recently seen
+        walls past max_walls"""
+        alive = np.nonzero(self._alive)[0]
+        if self.max_age is not None:
+            stale = alive[self.frame - self._last_seen[alive] > self.max_age]
+            for wall_id in stale:
+                self._remove(wall_id)
+            alive = np.nonzero(self._alive)[0]
+        if self.max_walls is not None and len(alive) > self.max_walls:
+            oldest = alive[np.argsort(self._last_seen[alive], kind="stable")]
+            for wall_id in oldest[:len(alive) - self.max_walls]:
+                self._remove(wall_id)
+
+    def _observe(self, segment):
+        """merge segment into the walls it lines up with, or add it as a new wall"""
+        matches = [wall_id for wall_id in self._candidates(segment, self.merge_distance + self.merge_gap)
+            if self._lines_up(self._segments[wall_id], segment)]
+        weight = 1.
+        for wall_id in matches:
+            segment, weight = self._fuse(self._segments[wall_id], self._weights[wall_id], segment, weight)
+            self._remove(wall_id)
+        return self._insert(segment, min(weight, self.max_weight))
+
+    def _lines_up(self, wall, segment):
+        """whether segment is close to and parallel with wall, and overlaps
+        it or leaves a gap of at most merge_gap along it"""
+        direction = wall[2:] - wall[:2]
+        length = np.hypot(*direction)
+        if length == 0:
+            return False
+        direction /= length
+        other = segment[2:] - segment[:2]
+        cos_angle = abs(direction @ other) / max(np.hypot(*other), 1e-12)
+        if cos_angle < np.cos(self.merge_angle):
+            return False
+        ends = segment.reshape(2, 2) - wall[:2]
+        across = ends @ np.array([-direction[1], direction[0]])
+        if np.any(np.abs(across) > self.merge_distance):
+            return False
+        along = ends @ direction
+        return along.max() >= -self.merge_gap and along.min() <= length + self.merge_gap
+
+    def _fuse(self, a, a_weight, b, b_weight):
+        """the weighted average line of two segments, spanning both"""
+        da, db = a[2:] - a[:2], b[2:] - b[:2]
+        if da @ db < 0:
+            db = -db
+        direction = a_weight * da / np.hypot(*da) + b_weight * db / np.hypot(*db)
+        direction /= np.hypot(*direction)
+        center = (a_weight * (a[:2] + a[2:]) + b_weight * (b[:2] + b[2:])) / (2 * (a_weight + b_weight))
+        along = (np.vstack([a.reshape(2, 2), b.reshape(2, 2)]) - center) @ direction
+        fused = np.concatenate([center + along.min() * direction, center + along.max() * direction])
+        return fused, a_weight + b_weight
+
+    def _cells_of(self, segment):
+        """the grid cells a segment passes through, sampled every half cell"""
+        start, end = segment[:2], segment[2:]
+        n = int(np.ceil(2 * np.hypot(*(end - start)) / self.cell_size)) + 1
+        points = start + np.linspace(0, 1, n)[:, None] * (end - start)
+        return set(map(tuple, np.floor(points / self.cell_size).astype(np.int64).tolist()))
+
+    def _candidates(self, shape, radius):
+        """ids of the walls registered in cells within radius of a point or
+        a segment. One cell of margin covers cells a wall only clips a
+        corner of, which sampling can miss."""
+        shape = np.asarray(shape, dtype=float).reshape(-1, 2)
+        low = np.floor((shape.min(axis=0) - radius) / self.cell_size).astype(np.int64) - 1
+        high = np.floor((shape.max(axis=0) + radius) / self.cell_size).astype(np.int64) + 1
+        found = set()
+        for i in range(low[0], high[0] + 1):
+            for j in range(low[1], high[1] + 1):
+                found.update(self._cells.get((i, j), ()))
+        return np.array(sorted(found), dtype=np.intp)
+
+    def _allocate(self):
+        """a free row for a new wall, growing the arrays when there isn't one"""
+        if self._free:
+            return self._free.pop()
+        n = len(self._alive)
+        capacity = max(2 * n, 16)
+        self._segments = np.resize(self._segments, (capacity, 4))
+        self._weights = np.resize(self._weights, capacity)
+        self._last_seen = np.resize(self._last_seen, capacity)
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - n, dtype=bool)])
+        self._free = list(range(capacity - 1, n, -1))
+        return n
+
+    def _insert(self, segment, weight):
+        wall_id = self._allocate()
+        self._segments[wall_id] = segment
+        self._weights[wall_id] = weight
+        self._last_seen[wall_id] = self.frame
+        self._alive[wall_id] = True
+        for cell in self._cells_of(segment):
+            self._cells.setdefault(cell, set()).add(wall_id)
+        return wall_id
+
+    def _remove(self, wall_id):
+        for cell in self._cells_of(self._segments[wall_id]):
+            walls = self._cells[cell]
+            walls.discard(wall_id)
+            if not walls:
+                del self._cells[cell]
+        self._alive[wall_id] = False
+        self._free.append(wall_id)